@@ -1,5 +1,41 @@
+from itertools import chain
+from os.path import dirname, join
+from random import Random
+from sys import argv
+from time import perf_counter
+
 import PDDL
 
+PREDICATES = "FFree(x) BFree(x) LFree(x) RFree(x) Captured(x) Kinged(x) Own(x)"
+TEMPLATE = join(dirname(__file__), "checkers_template.pddl")
+template_worlds = {}
+zobrist_tables = {}
+
+
+def template_world(path=TEMPLATE):
+    # The template domain is read and parsed once, compiled boards copy its actions.
+    if path not in template_worlds:
+        with open(path, "r") as f:
+            template_worlds[path] = PDDL.World.read(chain([f"predicates: {PREDICATES}"], f))
+    return template_worlds[path]
+
+
+def zobrist_table(size):
+    # One random key per (square, color, kinged) and one for red to move, seeded by size so every board of a
+    # size hashes the same way.
+    if size not in zobrist_tables:
+        rng = Random(size)
+        keys = {(i, color, kinged): rng.getrandbits(64)
+                for i in range(size * size) for color in "BR" for kinged in [False, True]}
+        zobrist_tables[size] = (keys, rng.getrandbits(64))
+    return zobrist_tables[size]
+
+
+def pddl_predicate(name, term):
+    p = PDDL.Predicate(name)
+    p.terms = [PDDL.Constant(term) if term[0].isupper() else PDDL.Variable(term)]
+    return p
+
 
 class Piece:
     last_discriminator = 0
@@ -141,37 +177,43 @@ class Board:
         selected.location = new
         return True
 
-    def position_to_frees(self, x, y, text="piece", color="B"):
+    def free_names(self, x, y, color="B"):
         frees = []
         for i in range(x):
-            frees.append(f"LFree({text})")
+            frees.append("LFree")
         for i in range(self.size - x - 1):
-            frees.append(f"RFree({text})")
+            frees.append("RFree")
         if color == "B":
             for i in range(y):
-                frees.append(f"BFree({text})")
+                frees.append("BFree")
             for i in range(self.size - y - 1):
-                frees.append(f"FFree({text})")
+                frees.append("FFree")
         else:
             for i in range(y + 1):
-                frees.append(f"FFree({text})")
+                frees.append("FFree")
             for i in range(self.size - y - 1):
-                frees.append(f"BFree({text})")
+                frees.append("BFree")
         return frees
 
+    def position_to_frees(self, x, y, text="piece", color="B"):
+        return [f"{name}({text})" for name in self.free_names(x, y, color)]
+
+    def position_to_free_predicates(self, x, y, term="piece", color="B"):
+        return [pddl_predicate(name, term) for name in self.free_names(x, y, color)]
+
     def pddl_piece_position(self, piece):
         for p in self.pieces:
             if p.pddl_name == piece.value:
                 return p.location
 
-    def generate_capture_pddl(self, piece):
+    def capture_moves(self, piece):
         attack_positions = [
             (piece.location[0] - 1, piece.location[1] - 1, "FR"),  # Back Left of p
             (piece.location[0] + 1, piece.location[1] - 1, "FL"),  # Back Right of p
             (piece.location[0] - 1, piece.location[1] + 1, "BR"),  # Front Left of p
             (piece.location[0] + 1, piece.location[1] + 1, "BL"),  # Front Right of p
         ]
-        actions = []
+        moves = []
         for pos in attack_positions:
             if pos[0] < 0 or pos[0] >= self.size:
                 continue  # Remove if OOB.
@@ -188,18 +230,44 @@ class Board:
                 continue  # Remove if landing position is OOB.
             if len([x for x in self.pieces if x.location == (landing_x, landing_y)]) > 0:
                 continue  # Remove if landing position is unreachable.
+            moves.append((pos, (landing_x, landing_y)))
+        return moves
+
+    def generate_capture_pddl(self, piece):
+        actions = []
+        for pos, landing in self.capture_moves(piece):
             if pos[2][-2] == "B":
                 act = (f"Capture{piece.pddl_name}_{pos[2]} piece\n"
                        f"pre: {' '.join(self.position_to_frees(pos[0], pos[1]))} Own(piece) Kinged(piece)\n"
                        f"preneg: Captured({piece.pddl_name})\n"
                        f"del: {' '.join(self.position_to_frees(pos[0], pos[1]))}\n"
-                       f"add: {' '.join(self.position_to_frees(landing_x, landing_y))} Captured({piece.pddl_name})\n")
+                       f"add: {' '.join(self.position_to_frees(*landing))} Captured({piece.pddl_name})\n")
             else:
                 act = (f"Capture{piece.pddl_name}_{pos[2]} piece\n"
                        f"pre: {' '.join(self.position_to_frees(pos[0], pos[1]))} Own(piece)\n"
                        f"preneg: Captured({piece.pddl_name})\n"
                        f"del: {' '.join(self.position_to_frees(pos[0], pos[1]))}\n"
-                       f"add: {' '.join(self.position_to_frees(landing_x, landing_y))} Captured({piece.pddl_name})\n")
+                       f"add: {' '.join(self.position_to_frees(*landing))} Captured({piece.pddl_name})\n")
+            actions.append(act)
+        return actions
+
+    def capture_actions(self, piece):
+        actions = []
+        for pos, landing in self.capture_moves(piece):
+            act = PDDL.Action(f"Capture{piece.pddl_name}_{pos[2]}")
+            act.terms = [PDDL.Variable("piece")]
+            act.preconditions = PDDL.Precondtions()
+            act.preconditions.predicates = self.position_to_free_predicates(pos[0], pos[1])
+            act.preconditions.predicates.append(pddl_predicate("Own", "piece"))
+            if pos[2][-2] == "B":
+                act.preconditions.predicates.append(pddl_predicate("Kinged", "piece"))
+            act.negative_preconditions = PDDL.NegativePrecondtions()
+            act.negative_preconditions.predicates = [pddl_predicate("Captured", piece.pddl_name)]
+            act.delete = PDDL.DeleteActions()
+            act.delete.predicates = self.position_to_free_predicates(pos[0], pos[1])
+            act.add = PDDL.AddActions()
+            act.add.predicates = self.position_to_free_predicates(*landing)
+            act.add.predicates.append(pddl_predicate("Captured", piece.pddl_name))
             actions.append(act)
         return actions
 
@@ -210,8 +278,15 @@ class Board:
             preds.append(f"Kinged({piece.pddl_name})")
         return preds
 
+    def init_own_piece_predicates(self, piece):
+        preds = self.position_to_free_predicates(piece.location[0], piece.location[1], term=piece.pddl_name)
+        preds.append(pddl_predicate("Own", piece.pddl_name))
+        if piece.kinged:
+            preds.append(pddl_predicate("Kinged", piece.pddl_name))
+        return preds
+
     def generate_pddl(self, color="B"):
-        predicates = "predicates: FFree(x) BFree(x) LFree(x) RFree(x) Captured(x) Kinged(x) Own(x)"
+        predicates = f"predicates: {PREDICATES}"
         constants = f"constants: {' '.join([p.pddl_name for p in self.pieces if p.color == color])}"
         actions = []
         init = []
@@ -222,7 +297,7 @@ class Board:
             else:
                 actions.extend(self.generate_capture_pddl(piece))
                 goal.append(f"Captured({piece.pddl_name})")
-        with open("checkers_template.pddl", "r") as f:
+        with open(TEMPLATE, "r") as f:
             base_actions = f.read()
             aditional_actions = "\n".join(actions)
             out = (f"# Checkers({self.size}x{self.size})\n\n"
@@ -235,37 +310,500 @@ class Board:
                    f"goal: {' '.join(goal)}")
             return out
 
-    def action_call_to_move_instruction(self, action_call):
-        if action_call.name.startswith("Move"):
-            return self.pddl_piece_position(action_call.terms[0]), action_call.name[-2:].lower()
-        elif action_call.name.startswith("Capture"):
-            return self.pddl_piece_position(action_call.terms[0]), "c" + action_call.name[-2:].lower()
+    def compile_world(self, color="B"):
+        # Builds the same World as parsing generate_pddl() without going through text.
+        template = template_world()
+        actions = [a.copy() for a in template.actions]
+        init = []
+        goal = []
+        for piece in self.pieces:
+            if piece.color == color:
+                init.extend(self.init_own_piece_predicates(piece))
+            else:
+                actions.extend(self.capture_actions(piece))
+                goal.append(pddl_predicate("Captured", piece.pddl_name))
+        return PDDL.World.from_objects([p.copy() for p in template.predicates],
+                                       [PDDL.Constant(p.pddl_name) for p in self.pieces if p.color == color],
+                                       actions,
+                                       init,
+                                       goal)
+
+    @staticmethod
+    def action_direction(name):
+        # The move() direction of a Move or Capture action, None for any other action.
+        if name.startswith("Move"):
+            return name[-2:].lower()
+        elif name.startswith("Capture"):
+            return "c" + name[-2:].lower()
         else:
+            return None
+
+    def action_call_to_move_instruction(self, action_call):
+        direction = self.action_direction(action_call.name)
+        if direction is None:
             return None, None
+        return self.pddl_piece_position(action_call.terms[0]), direction
+
+    def step_destination(self, location, color, direction):
+        jump = 2 if direction[0] == "c" else 1
+        dx = -1 if direction[-1] == "l" else 1
+        dy = (1 if color == "B" else -1) * (-1 if direction[-2] == "b" else 1)
+        return location[0] + dx * jump, location[1] + dy * jump
 
-    def extract_plan(self, plan_head):
+    def extract_plan(self, state):
+        # Moves along the plan that reached state. Each piece is looked up once and its square is carried from
+        # step to step, so a piece's second move starts where its first one ended.
+        pieces = {p.pddl_name: p for p in self.pieces}
+        squares = {name: p.location for name, p in pieces.items()}
         steps = []
-        current = plan_head
-        while current is not None:
-            step = self.action_call_to_move_instruction(current)
-            if step != (None, None):
-                steps.insert(0, step)
-            try:
-                current = current.source_state.source_action_call
-            except AttributeError:
-                current = None
+        for action in state.plan():
+            direction = self.action_direction(action.name)
+            if direction is None:
+                continue
+            name = action.terms[0].value
+            location = squares.get(name)
+            steps.append((location, direction))
+            if location is not None:
+                squares[name] = self.step_destination(location, pieces[name].color, direction)
         return steps
 
 
+class BitBoard(Board):
+    # Same rules as Board, with one integer bitboard per color, one for kings and a square -> piece index.
+    # Directions are (dx, dy) for black, red pieces move with dy flipped.
+    directions = {"fl": (-1, 1), "fr": (1, 1), "bl": (-1, -1), "br": (1, -1)}
+
+    def __init__(self, size=4):
+        super().__init__(size)
+        self.full = (1 << (size * size)) - 1
+        self.zobrist_keys, self.side_key = zobrist_table(size)
+        self.steps = {}
+        for color, sign in [("B", 1), ("R", -1)]:
+            self.steps[color] = {}
+            for jump in [2, 1]:  # Captures first, they are usually the better move.
+                for name, (dx, dy) in self.directions.items():
+                    from_mask = 0
+                    for x in range(size):
+                        for y in range(size):
+                            if 0 <= x + dx * jump < size and 0 <= y + dy * sign * jump < size:
+                                from_mask |= self.bit((x, y))
+                    direction = name if jump == 1 else "c" + name
+                    self.steps[color][direction] = (dx, dy * sign, jump, from_mask)
+        self.reindex()
+
+    def index(self, location):
+        return location[1] * self.size + location[0]
+
+    def bit(self, location):
+        return 1 << self.index(location)
+
+    def location(self, index):
+        return index % self.size, index // self.size
+
+    def reindex(self):
+        # Rebuilds the bitboards from self.pieces, call after editing the piece list by hand.
+        self.colors = {"B": 0, "R": 0}
+        self.kings = 0
+        self.squares = {}
+        self.by_name = {}
+        self.trail = []
+        self.zobrist = 0
+        for p in self.pieces:
+            self.put(p)
+
+    def put(self, piece):
+        i = self.index(piece.location)
+        b = 1 << i
+        self.zobrist ^= self.zobrist_keys[(i, piece.color, piece.kinged)]
+        self.colors[piece.color] |= b
+        if piece.kinged:
+            self.kings |= b
+        self.squares[piece.location] = piece
+        self.by_name[piece.pddl_name] = piece
+
+    def take(self, piece):
+        i = self.index(piece.location)
+        b = 1 << i
+        self.zobrist ^= self.zobrist_keys[(i, piece.color, piece.kinged)]
+        self.colors[piece.color] &= ~b
+        self.kings &= ~b
+        del self.squares[piece.location]
+        del self.by_name[piece.pddl_name]
+
+    def key(self, to_move):
+        return self.zobrist ^ self.side_key if to_move == "R" else self.zobrist
+
+    def occupied(self):
+        return self.colors["B"] | self.colors["R"]
+
+    def print_board(self):
+        cols = ""
+        for j in range(self.size):
+            cols += f" {j} "
+        print(f"   {cols} ")
+        print(f"  {'-' * (self.size * 3)}-")
+        for j in range(self.size):
+            row = [str(self.squares[(i, j)]) if (i, j) in self.squares else "  " for i in range(self.size)]
+            print(f"{j} |" + "|".join(row) + "|")
+        print(f"  {'-' * (self.size * 3)}-")
+
+    def move(self, current, direction):
+        if current is None or direction is None:
+            return False
+        selected = self.squares.get(current)
+        if selected is None:
+            return False
+        if direction == "kill":
+            self.trail.append((None, None, False, selected, self.pieces.index(selected)))
+            self.take(selected)
+            self.pieces.remove(selected)
+            return True
+        if direction not in self.steps[selected.color]:
+            return False
+        if direction[-2] == "b" and not selected.kinged:
+            return False
+        dx, dy, jump, from_mask = self.steps[selected.color][direction]
+        if not self.bit(current) & from_mask:  # OOB
+            return False
+        new = (current[0] + dx * jump, current[1] + dy * jump)
+        if self.bit(new) & self.occupied():  # Overlapping Piece.
+            return False
+        to_capture = None
+        if jump == 2:  # Attempting to capture.
+            to_capture = self.squares.get((current[0] + dx, current[1] + dy))
+            if to_capture is None:  # Nothing to capture.
+                return False
+            if to_capture.color == selected.color:  # Capturing own piece.
+                return False
+            self.trail.append((selected, current, selected.kinged, to_capture, self.pieces.index(to_capture)))
+            self.take(to_capture)
+            self.pieces.remove(to_capture)
+        else:
+            self.trail.append((selected, current, selected.kinged, None, None))
+        self.take(selected)
+        if selected.color == "B" and new[1] == self.size - 1:
+            selected.kinged = True
+        if selected.color == "R" and new[1] == 0:
+            selected.kinged = True
+        selected.location = new
+        self.put(selected)
+        return True
+
+    def unmove(self):
+        # Takes back the last successful move(), captured pieces go back to their place in self.pieces.
+        piece, location, kinged, removed, index = self.trail.pop()
+        if piece is not None:
+            self.take(piece)
+            piece.location = location
+            piece.kinged = kinged
+            self.put(piece)
+        if removed is not None:
+            self.pieces.insert(index, removed)
+            self.put(removed)
+
+    def legal_moves(self, color):
+        # Every (location, direction) move() accepts for color, captures first.
+        own = self.colors[color]
+        enemy = self.colors["R" if color == "B" else "B"]
+        empty = self.full & ~(own | enemy)
+        moves = []
+        for direction, (dx, dy, jump, from_mask) in self.steps[color].items():
+            movers = (own & self.kings if direction[-2] == "b" else own) & from_mask
+            shift = dy * self.size + dx
+            if shift > 0:
+                targets = movers << shift
+                if jump == 2:
+                    targets = (targets & enemy) << shift
+            else:
+                targets = movers >> -shift
+                if jump == 2:
+                    targets = (targets & enemy) >> -shift
+            targets &= empty
+            while targets:
+                low = targets & -targets
+                moves.append((self.location(low.bit_length() - 1 - shift * jump), direction))
+                targets ^= low
+        return moves
+
+    def pddl_piece_position(self, piece):
+        p = self.by_name.get(piece.value)
+        if p is not None:
+            return p.location
+
+    def capture_moves(self, piece):
+        # Matches Board.capture_moves, whose attack position check never fires (it compares against the named
+        # 3-tuple), so an occupied attack position is kept. The blocker can move away during the plan.
+        moves = []
+        x, y = piece.location
+        occupied = self.occupied()
+        for dx, dy, name in [(-1, -1, "FR"), (1, -1, "FL"), (-1, 1, "BR"), (1, 1, "BL")]:
+            landing = (x - dx, y - dy)
+            if not (0 <= x + dx < self.size and 0 <= y + dy < self.size):
+                continue  # Remove if OOB.
+            if not (0 <= landing[0] < self.size and 0 <= landing[1] < self.size):
+                continue  # Remove if landing position is OOB.
+            if self.bit(landing) & occupied:
+                continue  # Remove if landing position is unreachable.
+            moves.append(((x + dx, y + dy, name), landing))
+        return moves
+
+
+class AlphaBeta:
+    # Iterative deepening negamax with alpha-beta pruning over a BitBoard. A capture keeps the turn, so the
+    # score is only negated when the side to move changes.
+    win = 1000000
+    exact, lower, upper = range(3)
+
+    def __init__(self, budget=1.0, max_depth=32, table=None):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table = table  # Optional PDDL.TranspositionTable keyed by BitBoard.key().
+        self.history = {}
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.deadline = None
+
+    def evaluate(self, board, color):
+        # Material, kings worth a man and a half, men a little more the closer they are to crowning.
+        score = 0
+        for p in board.pieces:
+            if p.kinged:
+                value = 150
+            elif p.color == "B":
+                value = 100 + p.location[1]
+            else:
+                value = 100 + board.size - 1 - p.location[1]
+            score += value if p.color == color else -value
+        return score
+
+    def order(self, moves, first=None):
+        # Captures first (legal_moves already lists them first), then by history score.
+        moves.sort(key=lambda m: (m != first, m[1][0] != "c", -self.history.get(m, 0)))
+        return moves
+
+    def negamax(self, board, color, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and perf_counter() > self.deadline:
+            raise PDDL.SearchTimeout()
+        other = "R" if color == "B" else "B"
+        if board.colors[other] == 0:
+            return self.win - ply
+        moves = board.legal_moves(color)
+        if len(moves) == 0:
+            return ply - self.win
+        if depth == 0:
+            return self.evaluate(board, color)
+        key = None
+        table_move = None
+        if self.table is not None:
+            key = board.key(color)
+            entry = self.table.probe(key)
+            if entry is not None:
+                entry_depth, (score, bound, table_move) = entry
+                if entry_depth >= depth:
+                    score = self.from_table(score, ply)
+                    if bound == self.exact:
+                        return score
+                    if bound == self.lower and score >= beta:
+                        return score
+                    if bound == self.upper and score <= alpha:
+                        return score
+        alpha_start = alpha
+        best = -self.win
+        best_move = None
+        for m in self.order(moves, table_move):
+            board.move(*m)
+            try:
+                if m[1][0] == "c":
+                    score = self.negamax(board, color, depth - 1, alpha, beta, ply + 1)
+                else:
+                    score = -self.negamax(board, other, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmove()
+            if score > best:
+                best = score
+                best_move = m
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.history[m] = self.history.get(m, 0) + depth * depth
+                break
+        if key is not None:
+            if best <= alpha_start:
+                bound = self.upper
+            elif best >= beta:
+                bound = self.lower
+            else:
+                bound = self.exact
+            self.table.store(key, depth, (self.to_table(best, ply), bound, best_move))
+        return best
+
+    def to_table(self, score, ply):
+        # Win and loss scores count plies from the root, the table keeps them relative to the stored position.
+        if score > self.win - 1000:
+            return score + ply
+        if score < 1000 - self.win:
+            return score - ply
+        return score
+
+    def from_table(self, score, ply):
+        if score > self.win - 1000:
+            return score - ply
+        if score < 1000 - self.win:
+            return score + ply
+        return score
+
+    def search(self, board, color):
+        # Deepens until the budget runs out and returns the best move of the deepest finished iteration.
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = perf_counter() + self.budget
+        other = "R" if color == "B" else "B"
+        moves = board.legal_moves(color)
+        if len(moves) == 0:
+            return None
+        best_move = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            alpha = -self.win
+            iteration_best = None
+            try:
+                for m in self.order(moves, best_move):
+                    board.move(*m)
+                    try:
+                        if m[1][0] == "c":
+                            score = self.negamax(board, color, depth - 1, alpha, self.win, 1)
+                        else:
+                            score = -self.negamax(board, other, depth - 1, -self.win, -alpha, 1)
+                    finally:
+                        board.unmove()
+                    if iteration_best is None or score > alpha:
+                        alpha = score
+                        iteration_best = m
+            except PDDL.SearchTimeout:
+                break
+            best_move = iteration_best
+            self.depth = depth
+            self.score = alpha
+            if abs(alpha) >= self.win - self.max_depth:  # Forced win or loss found.
+                break
+        return best_move
+
+
+class PlanningSession:
+    # Keeps one world and one search tree between moves. After the other side moves, the search goes on from the
+    # node of the new position with the subtree already explored below it, and cached successor lists and
+    # heuristic values carry over too.
+    def __init__(self, board, color="B", weight=2, depth=3, table=None, budget=None):
+        self.board = board
+        self.color = color
+        self.weight = weight
+        self.depth = depth
+        self.budget = budget  # Seconds per plan() call. When set, depth grows until it runs out instead.
+        self.table = table  # Optional PDDL.TranspositionTable of plans by BitBoard.key(), for positions seen again.
+        self.world = board.compile_world(color)
+        self.world.successor_cache = {}
+        # Both live as long as the session, positions repeat between turns and hlits values survive sync().
+        self.heuristic = PDDL.HeuristicCache(PDDL.hlits)
+        self.inv_heuristic = PDDL.HeuristicCache(PDDL.hlits_inv)
+        self.tree = PDDL.SearchTree(self.world, self.heuristic, weight)
+
+    def capture_actions(self):
+        actions = {}
+        for piece in self.board.pieces:
+            if piece.color != self.color:
+                for action in self.board.capture_actions(piece):
+                    actions[action.name] = action
+        return actions
+
+    def position(self):
+        atoms = []
+        for piece in self.board.pieces:
+            if piece.color == self.color:
+                atoms.extend([self.world.symbols.grounded(p) for p in self.board.init_own_piece_predicates(piece)])
+        on_board = [p.pddl_name for p in self.board.pieces]
+        for a in set(self.world.goal_atoms):
+            if self.world.symbols.atoms[a].terms[0].value not in on_board:  # Captured since the session started.
+                atoms.append(a)
+        return self.world.count_atoms(atoms)
+
+    def sync(self):
+        # Only capture actions depend on where the other side's pieces are, swap in the ones that changed.
+        # reroot() moves the initial state to the board's position, the next search re-roots the tree there.
+        old = {a.name: str(a) for a in self.world.actions if a.name.startswith("Capture")}
+        new = self.capture_actions()
+        removed = [name for name in old if name not in new or old[name] != str(new[name])]
+        added = [a for name, a in new.items() if name not in old or old[name] != str(a)]
+        if len(removed) > 0 or len(added) > 0:
+            self.world.replace_actions(removed, added)
+        self.world.reroot(self.position())
+
+    def plan(self):
+        if self.budget is not None:
+            return self.plan_until(perf_counter() + self.budget)
+        if self.table is not None:
+            entry = self.table.probe(self.board.key(self.color))
+            if entry is not None and entry[0] >= self.depth:
+                return entry[1]
+        self.sync()
+        plans = self.world.partial_wastar(self.heuristic, self.inv_heuristic, self.weight, self.depth,
+                                          tree=self.tree)
+        if self.table is not None:
+            self.table.store(self.board.key(self.color), self.depth, plans)
+        return plans
+
+    def plan_until(self, deadline):
+        # Anytime planning: searches one level deeper each round and returns the deepest finished result.
+        # Every level stops at the deadline. If not even the first one finished, the positions one move away are
+        # returned, so there is a plan whenever there is a move.
+        plans = []
+        depth = 0
+        if self.table is not None:
+            entry = self.table.probe(self.board.key(self.color))
+            if entry is not None:
+                depth, plans = entry
+                if self.world.state_goal_counters(plans[0])[0] == 0:
+                    return plans
+        self.sync()
+        while perf_counter() < deadline:
+            try:
+                deeper = self.world.partial_wastar(self.heuristic, self.inv_heuristic, self.weight, depth + 1,
+                                                   deadline, tree=self.tree)
+            except PDDL.SearchTimeout:
+                break
+            if len(deeper) == 0:  # Every reachable position is shallower, searching deeper changes nothing.
+                break
+            depth += 1
+            plans = deeper
+            if self.table is not None:
+                self.table.store(self.board.key(self.color), depth, plans)
+            if self.world.state_goal_counters(plans[0])[0] == 0:
+                break
+        if depth == 0:
+            plans = self.first_moves()
+        return plans
+
+    def first_moves(self):
+        # One expansion of the current position, ordered the way partial_wastar orders its results.
+        start = self.world.inital_state
+        states = [op.apply(start) for op in self.world.applicable(start.counts)]
+        states.sort(key=lambda x: x.cost + self.weight * self.inv_heuristic(self.world, x))
+        return states
+
+
 if __name__ == "__main__":
     t_plan = [
     ]
     size = input("Board size? (>3): ")
-    board = Board(size=int(size))
+    board = BitBoard(size=int(size))
     board.print_board()
-    comp_wrl = PDDL.World(*PDDL.World.parse(board.generate_pddl())[1:])
-    comp_plan_depth = 3
     comp_plan_weight = 2
+    # Checkers.py [plan|search] [seconds per move]
+    engine = argv[1] if len(argv) > 1 else "plan"
+    comp_move_budget = float(argv[2]) if len(argv) > 2 else 1.0
+    session = PlanningSession(board, "B", comp_plan_weight, table=PDDL.TranspositionTable(1 << 12),
+                              budget=comp_move_budget)
+    searcher = AlphaBeta(comp_move_budget, table=PDDL.TranspositionTable(1 << 18))
     game_over = False
     turn = "B"
     plan = None
@@ -273,32 +811,36 @@ if __name__ == "__main__":
     print("Movement: c for capture, f/b for piece forward or backward, l/r for left or right")
     print("          so capturing forward and right is \"cfr\"")
     while not game_over:
-        if turn == "B":
+        if turn == "B" and engine == "search":
+            print("Computer Turn.")
+            move = searcher.search(board, "B")
+            if move is None:
+                game_over = True
+                print("Computer cannot find a valid strategy. Red wins.")
+            else:
+                print(f"Searched to depth {searcher.depth} ({searcher.nodes} nodes, "
+                      f"{searcher.table.stats()['hit_rate']:.0%} table hits).")
+                board.move(*move)
+                if move[1][0] != "c":
+                    turn = "R"
+        elif turn == "B":
             captured = False
             print("Computer Turn.")
             failed_moves = 0
             out_of_moves = False
+            plans = None  # At most one plan() per computer move, so the move stays within its time budget.
             if plan is None or len(plan) == 0:
-                comp_wrl = PDDL.World(*PDDL.World.parse(board.generate_pddl())[1:])
-                plan = board.extract_plan(
-                    comp_wrl.partial_wastar(
-                        PDDL.hlits,
-                        PDDL.hlits_inv,
-                        comp_plan_weight,
-                        comp_plan_depth)[0].source_action_call)
+                plans = session.plan()
+                plan = board.extract_plan(plans[0])
             captured = (plan[0][1][0] == "c")
             validity = board.move(*plan.pop(0))
             if not validity:
                 captured = False
-                comp_wrl = PDDL.World(*PDDL.World.parse(board.generate_pddl())[1:])
-                plans = comp_wrl.partial_wastar(
-                    PDDL.hlits,
-                    PDDL.hlits_inv,
-                    comp_plan_weight,
-                    comp_plan_depth)
+                if plans is None:
+                    plans = session.plan()
                 while not validity and not out_of_moves:
                     try:
-                        plan = board.extract_plan(plans[failed_moves].source_action_call)
+                        plan = board.extract_plan(plans[failed_moves])
                         captured = (plan[0][1][0] == "c")
                         validity = board.move(*plan.pop(0))
                         failed_moves += 1
@@ -1,8 +1,28 @@
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from sys import argv, stdin
-from typing import Self, Optional, Callable
+from hashlib import blake2b
+from heapq import heapify, heappush, heappop, merge
+from itertools import product
+import json
+import mmap
+import multiprocessing
+from os import cpu_count, listdir, makedirs, remove, replace, truncate
+from os.path import exists, getsize, join
+import queue
+import re
+from struct import Struct
+from sys import argv, stdin, stdout
+from time import perf_counter
+from typing import Self, Optional, Callable, Iterable, Iterator, TextIO
 from datetime import datetime
 
+try:
+    import numpy as np
+except ImportError:  # Only VectorBackend needs numpy.
+    np = None
+
 
 class TokenType(Enum):
     COMMENT = "Comment"
@@ -80,11 +100,10 @@ class Variable:
 
 
 class Predicate:
-    def __init__(self, name: str, parent=None, became_true=-1):
+    def __init__(self, name: str, parent=None):
         self.name = name
         self.terms = []
         self.parent = parent
-        self.became_true = became_true
 
     def __str__(self):
         return f"{self.name}({', '.join([str(term) for term in self.terms])})"
@@ -175,6 +194,38 @@ class DeleteActions:
         return new
 
 
+class SymbolTable:
+    def __init__(self):
+        self.constant_ids = {}
+        self.constants = []
+        self.atom_ids = {}
+        self.atoms = []
+
+    def __len__(self):
+        return len(self.atoms)
+
+    def constant(self, value: str) -> int:
+        if value not in self.constant_ids:
+            self.constant_ids[value] = len(self.constants)
+            self.constants.append(Constant(value))
+        return self.constant_ids[value]
+
+    def atom(self, name: str, args: tuple) -> int:
+        key = (name, args)
+        if key not in self.atom_ids:
+            self.atom_ids[key] = len(self.atoms)
+            p = Predicate(name)
+            p.terms = [self.constants[c] for c in args]
+            self.atoms.append(p)
+        return self.atom_ids[key]
+
+    def grounded(self, pred: Predicate) -> int:
+        return self.atom(pred.name, tuple(self.constant(t.value) for t in pred.terms))
+
+    def binding(self, terms: list[Constant]) -> list[int]:
+        return [self.constant_ids[t.value] for t in terms]
+
+
 class ActionCall:
     def __init__(self, name: str, terms: list[Constant], source_state=None):
         self.name = name
@@ -189,11 +240,26 @@ class ActionCall:
 
 
 class State:
-    def __init__(self, preds: list[Predicate], wrl, cost: int, source_action_call: Optional[ActionCall] = None):
-        self.preds = preds
+    __slots__ = ("counts", "world", "cost", "call", "store", "node", "goals")
+
+    def __init__(self, counts: tuple, wrl, cost: int, source_action_call: Optional[ActionCall] = None,
+                 store: Optional["NodeStore"] = None, node: int = -1, goals: Optional[tuple] = None):
+        self.counts = counts  # Copies of each interned atom, indexed by atom id.
         self.world = wrl
         self.cost = cost
-        self.source_action_call = source_action_call
+        self.call = source_action_call
+        self.store = store  # States a search returns only keep their node, the path lives in the store.
+        self.node = node
+        self.goals = goals  # World.goal_counters of counts when a search already knows them.
+
+    @property
+    def source_action_call(self) -> Optional[ActionCall]:
+        if self.store is None:
+            return self.call
+        parent = self.store.parents[self.node]
+        if parent < 0:
+            return None
+        return self.store.operator(self.node).call(self.store.state(parent))
 
     def __str__(self):
         return f"{self.cost} {self.source_action_call} -> {self.preds}"
@@ -202,22 +268,476 @@ class State:
         return self.__str__()
 
     def __eq__(self, other):
-        for sp in self.preds:
-            if sp not in other.preds:
-                return False
-        for op in other.preds:
-            if op not in self.preds:
-                return False
-        return True
+        return self.counts == other.counts
+
+    def __hash__(self):
+        return hash(self.counts)
+
+    @property
+    def preds(self) -> list[Predicate]:
+        atoms = self.world.symbols.atoms
+        return [atoms[a] for a in range(len(self.counts)) for _ in range(self.counts[a])]
+
+    def key(self) -> tuple:
+        return self.counts
 
     def copy(self):
-        return State(self.preds.copy(), self.world, self.cost, self.source_action_call)
+        return State(self.counts, self.world, self.cost, self.call, self.store, self.node, self.goals)
+
+    def actions(self) -> list:
+        # The steps that led here, first to last: Operators for searched states, ActionCalls otherwise.
+        if self.store is not None:
+            return self.store.path(self.node)
+        steps = []
+        call = self.call
+        while call is not None:
+            steps.append(call)
+            call = call.source_state.source_action_call
+        steps.reverse()
+        return steps
+
+    def plan(self) -> "Plan":
+        return Plan(self)
 
     def print_acts(self):
-        if self.source_action_call is None:
-            return f""
-        else:
-            return f"{self.source_action_call.source_state.print_acts()}\n{self.cost - 1} {self.source_action_call}"
+        return "".join(["\n" + line for line in self.plan().lines()])
+
+
+class Plan:
+    # The steps that reached a state, built once front to back. Step i is taken at cost start + i.
+    def __init__(self, state: State):
+        self.state = state
+        self.steps = state.actions()
+        self.start = state.cost - len(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self) -> Iterator:
+        return iter(self.steps)
+
+    def __getitem__(self, i: int):
+        return self.steps[i]
+
+    def __str__(self):
+        return "\n".join(self.lines())
+
+    def lines(self) -> Iterator[str]:
+        for i, step in enumerate(self.steps):
+            yield f"{self.start + i} {step}"
+
+    def write(self, out: TextIO):
+        # Streams one line per step, nothing is joined into one string first.
+        for line in self.lines():
+            out.write(line)
+            out.write("\n")
+
+
+class NodeStore:
+    # Search nodes packed into arrays. Node i is keys[i], its counts packed as unsigned shorts (also the
+    # duplicate detection key), and parents[i], ops[i], costs[i], unmet[i] and missing[i]. Parents are node
+    # indexes, ops index the operator list the search started with, unmet and missing are the node's goal counters.
+    # The arrays are 64 bit on every platform, so a Checkpoint can copy them as they are.
+    __slots__ = ("world", "operators", "op_index", "keys", "parents", "ops", "costs", "unmet", "missing")
+
+    def __init__(self, wrl, operators: Optional[list] = None, op_index: Optional[dict] = None):
+        self.world = wrl
+        self.operators = operators if operators is not None else wrl.operators
+        self.op_index = op_index if op_index is not None else {op: i for i, op in enumerate(self.operators)}
+        self.keys = []
+        self.parents = array("q")
+        self.ops = array("q")
+        self.costs = array("q")
+        self.unmet = array("q")
+        self.missing = array("q")
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def pack(counts: tuple) -> bytes:
+        return array("H", counts).tobytes()
+
+    def add(self, key: bytes, parent: int, op: int, cost: int, goals: tuple) -> int:
+        self.keys.append(key)
+        self.parents.append(parent)
+        self.ops.append(op)
+        self.costs.append(cost)
+        self.unmet.append(goals[0])
+        self.missing.append(goals[1])
+        return len(self.keys) - 1
+
+    def counts(self, node: int) -> tuple:
+        return tuple(array("H", self.keys[node]))
+
+    def state(self, node: int) -> State:
+        return State(self.counts(node), self.world, self.costs[node], store=self, node=node, goals=self.goals(node))
+
+    def goals(self, node: int) -> tuple:
+        return self.unmet[node], self.missing[node]
+
+    def operator(self, node: int):
+        return self.operators[self.ops[node]]
+
+    def path(self, node: int) -> list:
+        steps = []
+        while self.parents[node] >= 0:
+            steps.append(self.operators[self.ops[node]])
+            node = self.parents[node]
+        steps.reverse()
+        return steps
+
+    def subset(self, nodes: list[int]) -> list[State]:
+        # Copies nodes and their ancestors into a fresh store, so results outlive the search's store.
+        kept = NodeStore(self.world, self.operators, self.op_index)
+        moved = {}
+        states = []
+        for node in nodes:
+            chain = []
+            n = node
+            while n >= 0 and n not in moved:
+                chain.append(n)
+                n = self.parents[n]
+            for n in reversed(chain):
+                parent = self.parents[n]
+                moved[n] = kept.add(self.keys[n], moved[parent] if parent >= 0 else -1, self.ops[n], self.costs[n],
+                                    self.goals(n))
+            states.append(kept.state(moved[node]))
+        return states
+
+
+class BucketStore:
+    # Search buckets on disk for World.external_wastar. Bucket (g, h) is a set of fixed size records: a state's
+    # counts as unsigned shorts, the index of the operator that reached it and its parent's h. Generated records
+    # are appended to the bucket's .open file, once expanded they are merged into its .closed file, which stays
+    # sorted by counts with one record per state. Files are read through read only memory maps and records only
+    # collect in RAM up to half the budget before they are written out.
+    version = 1
+
+    def __init__(self, directory: str, atoms: int, budget: int):
+        self.directory = directory
+        self.key_size = 2 * atoms
+        self.record = Struct(f"<{self.key_size}sid")
+        self.budget = budget
+        self.pending = {}  # (g, h) -> records not appended to the bucket's .open file yet.
+        self.pending_bytes = 0
+        makedirs(directory, exist_ok=True)
+
+    def file(self, g: int, h: float, kind: str) -> str:
+        return join(self.directory, f"{g}_{h!r}.{kind}")
+
+    def buckets(self, kind: str) -> list[tuple[int, float]]:
+        found = []
+        for name in listdir(self.directory):
+            stem, _, ext = name.rpartition(".")
+            if ext == kind:
+                g, h = stem.split("_")
+                found.append((int(g), float(h)))
+        return found
+
+    def load(self) -> Optional[dict]:
+        file = join(self.directory, "search.json")
+        if not exists(file):
+            return None
+        with open(file) as f:
+            return json.load(f)
+
+    def save(self, meta: dict):
+        file = join(self.directory, "search.json")
+        with open(file + ".tmp", "w") as f:
+            json.dump(meta, f)
+        replace(file + ".tmp", file)
+
+    def recover(self, partial: Optional[list] = None):
+        # Drops what an interrupted run left half done. partial is [g, h, records] for a bucket a deadline stopped:
+        # the first records of its .fresh file are expanded with their children written, they are kept and fresh
+        # skips them. Any other bucket whose expansion was cut short still has its .open file and is expanded
+        # again, the children it already wrote are duplicates and get dropped.
+        kept = self.file(partial[0], partial[1], "fresh") if partial is not None else None
+        for name in listdir(self.directory):
+            ext = name.rpartition(".")[2]
+            file = join(self.directory, name)
+            if file == kept:
+                truncate(file, min(getsize(file), partial[2] * self.record.size))
+            elif ext in ("tmp", "fresh") or ext.startswith("run"):
+                remove(file)
+            elif ext == "open":
+                size = getsize(join(self.directory, name))
+                truncate(join(self.directory, name), size - size % self.record.size)
+
+    def add(self, g: int, h: float, key: bytes, op: int, parent_h: float):
+        self.pending.setdefault((g, h), []).append(self.record.pack(key, op, parent_h))
+        self.pending_bytes += self.record.size
+        if self.pending_bytes > self.budget // 2:
+            self.flush()
+
+    def flush(self):
+        for (g, h), records in self.pending.items():
+            with open(self.file(g, h, "open"), "ab") as f:
+                f.write(b"".join(records))
+        self.pending = {}
+        self.pending_bytes = 0
+
+    def read(self, file: str) -> Iterator[bytes]:
+        size = self.record.size
+        if not exists(file) or getsize(file) < size:
+            return
+        with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for i in range(0, len(m) - size + 1, size):
+                yield m[i:i + size]
+
+    def write(self, file: str, records: Iterable[bytes]):
+        # Through a temporary file, so an interrupted write never replaces a complete one.
+        with open(file + ".tmp", "wb") as f:
+            f.writelines(records)
+        replace(file + ".tmp", file)
+
+    def sorted_open(self, g: int, h: float) -> Iterator[bytes]:
+        # The .open records sorted by counts. Runs that fit in the budget are sorted in memory, several runs are
+        # written out and merged back from disk.
+        per_run = max(1, self.budget // 2 // (self.record.size + 100))  # About 100 bytes per object on top.
+        runs = []
+        chunk = []
+        for r in self.read(self.file(g, h, "open")):
+            chunk.append(r)
+            if len(chunk) == per_run:
+                chunk.sort()
+                runs.append(self.file(g, h, f"run{len(runs)}"))
+                self.write(runs[-1], chunk)
+                chunk = []
+        chunk.sort()
+        if len(runs) == 0:
+            yield from chunk
+            return
+        runs.append(self.file(g, h, f"run{len(runs)}"))
+        self.write(runs[-1], chunk)
+        del chunk
+        try:
+            yield from merge(*[self.read(run) for run in runs])
+        finally:
+            for run in runs:
+                remove(run)
+
+    def fresh(self, g: int, h: float) -> Iterator[bytes]:
+        # One record per state of the .open file that is in no .closed bucket with the same h and g or less, nor
+        # in the bucket's .fresh file. A state's h never changes, so a copy reached as cheaply is always in one of
+        # those buckets. What a stopped expansion left in .fresh comes first in the same order, so fresh continues
+        # right after it.
+        k = self.key_size
+        streams = [((r[:k], 0, r) for r in self.read(self.file(cg, ch, "closed")))
+                   for cg, ch in self.buckets("closed") if ch == h and cg <= g]
+        streams.append((r[:k], 0, r) for r in self.read(self.file(g, h, "fresh")))
+        streams.append((r[:k], 1, r) for r in self.sorted_open(g, h))
+        last = None
+        for key, is_open, r in merge(*streams):
+            if key != last:
+                last = key
+                if is_open:
+                    yield r
+
+    def close(self, g: int, h: float):
+        # Moves the bucket's expanded records from its .fresh file into its .closed file.
+        closed = self.file(g, h, "closed")
+        self.write(closed, merge(self.read(closed), self.read(self.file(g, h, "fresh"))))
+        for kind in ("open", "fresh"):
+            if exists(self.file(g, h, kind)):
+                remove(self.file(g, h, kind))
+
+
+class OpenList:
+    def __init__(self):
+        self.heap = []
+        self.counter = 0
+        self.live = 0
+
+    def __len__(self):
+        return self.live
+
+    def push(self, item, f: float) -> list:
+        # Newer entries win ties on f, same order the old insert(0, ...) + stable sort gave.
+        self.counter += 1
+        entry = [f, -self.counter, item]
+        heappush(self.heap, entry)
+        self.live += 1
+        return entry
+
+    def remove(self, entry: list):
+        if entry[2] is not None:
+            entry[2] = None
+            self.live -= 1
+
+    def min_f(self) -> float:
+        while len(self.heap) > 0 and self.heap[0][2] is None:
+            heappop(self.heap)
+        return self.heap[0][0] if len(self.heap) > 0 else float("inf")
+
+    def pop(self):
+        while len(self.heap) > 0:
+            entry = heappop(self.heap)
+            if entry[2] is not None:  # Removed entries are dropped lazily.
+                self.live -= 1
+                return entry[2]
+        raise IndexError("pop from empty OpenList")
+
+    def entries(self) -> list[list]:
+        return [entry for entry in self.heap if entry[2] is not None]
+
+    def restore(self, entries: list[list], counter: int):
+        # Refills the list with saved [f, -counter, item] entries, later pushes keep breaking ties the same way.
+        self.heap = entries
+        heapify(self.heap)
+        self.counter = counter
+        self.live = len(entries)
+
+
+class SearchTree:
+    # What a partial_wastar run leaves behind: its nodes, cheapest known paths, expanded nodes and open list, so a
+    # later call continues where it stopped instead of starting over. Open entries are scored with the heuristic
+    # and weight the tree was made for.
+    def __init__(self, wrl, heuristic: Callable, weight: float):
+        self.heuristic = heuristic
+        self.weight = weight
+        self.reset(wrl)
+
+    def reset(self, wrl):
+        counts = wrl.inital_state.counts
+        self.nodes = NodeStore(wrl)
+        root = self.nodes.add(self.nodes.pack(counts), -1, -1, wrl.inital_state.cost, wrl.goal_counters(counts))
+        self.open_nodes = OpenList()
+        self.open_entries = {self.nodes.keys[root]: self.open_nodes.push(root, 0)}
+        self.best = {self.nodes.keys[root]: root}  # Packed counts -> node of the cheapest known path.
+        # Packed counts -> expanded node, insertion ordered so ties in the result keep expansion order.
+        self.closed = {}
+
+    def follow(self, wrl):
+        # Moves the tree to wrl's initial state and operators. The subtree below the new root is kept with its
+        # costs counted from there, everything else and every node reached through an operator wrl no longer has
+        # is dropped. Kept expanded nodes generate their children again, so whatever the dropped nodes stood for,
+        # and whatever new operators reach, is back on the open list.
+        key = NodeStore.pack(wrl.inital_state.counts)
+        old = self.nodes
+        if old.operators is wrl.operators and old.keys[0] == key:
+            return
+        root = self.best.get(key)
+        if root is None:
+            self.reset(wrl)
+            return
+        shift = old.costs[root] - wrl.inital_state.cost
+        needed = set()  # Live nodes and their ancestors, older nodes of a key no path runs through are left behind.
+        for n in self.best.values():
+            while n >= 0 and n not in needed:
+                needed.add(n)
+                n = old.parents[n]
+        operators = set(wrl.operators)
+        nodes = NodeStore(wrl)
+        moved = {root: nodes.add(key, -1, -1, wrl.inital_state.cost, old.goals(root))}
+        for n in range(root + 1, len(old)):  # Parents are stored before their children.
+            op = old.operator(n)
+            if n in needed and old.parents[n] in moved and op in operators:
+                moved[n] = nodes.add(old.keys[n], moved[old.parents[n]], nodes.op_index[op], old.costs[n] - shift,
+                                     old.goals(n))
+        self.nodes = nodes
+        self.best = {k: moved[n] for k, n in self.best.items() if n in moved}
+        self.closed = {k: moved[n] for k, n in self.closed.items() if n in moved}
+        entries = [[f - shift, tie, moved[n]] for f, tie, n in self.open_nodes.entries() if n in moved]
+        counter = self.open_nodes.counter
+        self.open_nodes = OpenList()
+        self.open_nodes.restore(entries, counter)
+        self.open_entries = {nodes.keys[entry[2]]: entry for entry in self.open_nodes.heap}
+        for node in list(self.closed.values()):
+            if self.closed.get(nodes.keys[node]) != node:  # Reopened by an earlier node in this loop.
+                continue
+            counts = nodes.counts(node)
+            cost = nodes.costs[node] + 1
+            for n, child in wrl.improved_children(nodes, node, counts, wrl.applicable(counts), self.best,
+                                                  self.open_nodes, self.open_entries):
+                self.closed.pop(nodes.keys[n], None)
+                h = self.heuristic(wrl, State(child, wrl, cost, goals=nodes.goals(n)))
+                self.open_entries[nodes.keys[n]] = self.open_nodes.push(n, cost + self.weight * h)
+
+
+class Checkpoint:
+    # Snapshots of a wastar run, written to file every interval seconds and when the run times out, and read back
+    # to resume it. One binary file: a fixed header, then the NodeStore arrays, the live open list entries and the
+    # values of a HeuristicCache as flat arrays in machine byte order, loaded through a memory map. Nothing is
+    # pickled. Files are replaced whole, a run killed while saving leaves the previous snapshot.
+    magic = b"PDDLCKPT"
+    version = 1
+    # magic, version, task digest, heuristic, weight, generated, expanded, open list counter, nodes, open entries,
+    # cached values, atoms
+    header = Struct("<8sI16s32sdqqqqqqq")
+
+    def __init__(self, file: str, interval: float = 60.0):
+        self.file = file
+        self.interval = interval
+        self.last = perf_counter()
+        self.saves = 0
+
+    def due(self) -> bool:
+        return perf_counter() - self.last >= self.interval
+
+    def save(self, wrl, heuristic: Callable, weight: float, nodes: NodeStore, open_nodes: OpenList,
+             generated: int, expanded: int):
+        entries = open_nodes.entries()
+        cached = []
+        if isinstance(heuristic, HeuristicCache):
+            task = heuristic.task_key(wrl)
+            cached = [(key[1], value) for key, value in heuristic.values.items() if key[0] == task]
+        with open(self.file + ".tmp", "wb") as f:
+            f.write(self.header.pack(self.magic, self.version, bytes.fromhex(wrl.digest()),
+                                     heuristic_name(heuristic).encode(), weight, generated, expanded,
+                                     open_nodes.counter, len(nodes), len(entries), len(cached), len(wrl.symbols)))
+            f.writelines(nodes.keys)
+            for column in (nodes.parents, nodes.ops, nodes.costs, nodes.unmet, nodes.missing):
+                f.write(column.tobytes())
+            f.write(array("d", [e[0] for e in entries]).tobytes())
+            f.write(array("q", [e[1] for e in entries]).tobytes())
+            f.write(array("q", [e[2] for e in entries]).tobytes())
+            f.writelines(NodeStore.pack(counts) for counts, _ in cached)
+            f.write(array("d", [value for _, value in cached]).tobytes())
+        replace(self.file + ".tmp", self.file)
+        self.last = perf_counter()
+        self.saves += 1
+
+    def load(self, wrl, heuristic: Callable, weight: float) -> Optional[tuple]:
+        # (nodes, open_nodes, open_entries, best, generated, expanded) as wastar keeps them, None without a file.
+        if not exists(self.file):
+            return None
+        with open(self.file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            (magic, version, digest, name, saved_weight, generated, expanded, counter, size, live, cached,
+             atoms) = self.header.unpack_from(m)
+            if magic != self.magic or version != self.version:
+                raise ValueError(f"{self.file} is not a version {self.version} checkpoint")
+            if digest.hex() != wrl.digest() or name.rstrip(b"\0").decode() != heuristic_name(heuristic) \
+                    or saved_weight != weight:
+                raise ValueError(f"{self.file} was saved by a different search")
+            key_size = 2 * atoms
+            pos = self.header.size
+
+            def column(typecode: str, n: int) -> array:
+                nonlocal pos
+                values = array(typecode)
+                values.frombytes(m[pos:pos + n * values.itemsize])
+                pos += n * values.itemsize
+                return values
+
+            nodes = NodeStore(wrl)
+            nodes.keys = [m[i:i + key_size] for i in range(pos, pos + size * key_size, key_size)]
+            pos += size * key_size
+            nodes.parents, nodes.ops, nodes.costs, nodes.unmet, nodes.missing = [column("q", size) for _ in range(5)]
+            fs, ties, items = column("d", live), column("q", live), column("q", live)
+            keys = [m[i:i + key_size] for i in range(pos, pos + cached * key_size, key_size)]
+            pos += cached * key_size
+            values = column("d", cached)
+        open_nodes = OpenList()
+        open_nodes.restore([[f, tie, item] for f, tie, item in zip(fs, ties, items)], counter)
+        open_entries = {nodes.keys[entry[2]]: entry for entry in open_nodes.heap}
+        best = {key: node for node, key in enumerate(nodes.keys)}  # A key's later nodes are always cheaper.
+        if isinstance(heuristic, HeuristicCache):
+            task = heuristic.task_key(wrl)
+            for key, value in zip(keys, values):
+                heuristic.values[(task, tuple(array("H", key)))] = value
+        return nodes, open_nodes, open_entries, best, generated, expanded
 
 
 class Action:
@@ -229,6 +749,7 @@ class Action:
         self.add = None
         self.delete = None
         self.world = wrl
+        self.templates = {}
 
     def __str__(self):
         return f"{self.name} {' '.join([str(term) for term in self.terms])}\n" \
@@ -239,97 +760,382 @@ class Action:
     def __repr__(self):
         return self.__str__()
 
-    def check_conditions(self, state: list[Predicate]) -> bool:
-        for p in self.preconditions.predicates:
-            if p not in state:
-                return False
-        for p in self.negative_preconditions.predicates:
-            if p in state:
-                return False
-        return True
-
-    def apply_actions(self, state: list[Predicate]) -> Optional[list[Predicate]]:
-        if self.check_conditions(state):
-            new_state = state.copy()
-            for d in self.delete.predicates:
-                new_state.remove(d)
-            for a in self.add.predicates:
-                new_state.append(a)
-            return new_state
-        return None
-
     def call(self, terms: list[Constant]) -> ActionCall:
         return ActionCall(self.name, terms)
 
-    def ground(self, constants: list[Constant]) -> list[ActionCall]:
-        calls = []
-        params = self.expand_params(len(self.terms), constants)
-        for p in params:
-            calls.append(ActionCall(self.name, p))
-        return calls
+    def copy(self, wrl=None):
+        new = Action(self.name, wrl)
+        new.terms = [t.copy() for t in self.terms]
+        new.preconditions = self.preconditions.copy()
+        new.negative_preconditions = self.negative_preconditions.copy()
+        new.add = self.add.copy()
+        new.delete = self.delete.copy()
+        return new
 
-    @staticmethod
-    def expand_params(terms: int, consts: list[Constant]) -> list[list[Constant]]:
-        out = []
-        if terms == 1:
-            for i in consts:
-                out.append([i])
-        else:
-            last = Action.expand_params(terms - 1, consts)
-            for c in consts:
-                l_copy = [ele.copy() for ele in last]
-                for ele in l_copy:
-                    ele.insert(0, c)
-                out.extend(l_copy)
-        return out
+    def compile_templates(self):
+        # Each template is (name, args) with a constant id for args >= 0 and parameter -(arg + 1) otherwise.
+        symbols = self.world.symbols
+        params = {t.value: i for i, t in enumerate(self.terms)}
+        for part, preds in [("pre", self.preconditions), ("preneg", self.negative_preconditions),
+                            ("add", self.add), ("del", self.delete)]:
+            self.templates[part] = [(p.name, tuple(-params[t.value] - 1 if isinstance(t, Variable)
+                                                   else symbols.constant(t.value) for t in p.terms))
+                                    for p in preds.predicates]
+
+    def ground_atoms(self, part: str, binding: list[int]) -> list[int]:
+        atom = self.world.symbols.atom
+        return [atom(name, tuple(binding[-a - 1] if a < 0 else a for a in args))
+                for name, args in self.templates[part]]
+
+
+class Operator:
+    def __init__(self, action: Action, terms: list[Constant], binding: list[int]):
+        self.name = action.name
+        self.terms = terms
+        self.world = action.world
+        pre = action.ground_atoms("pre", binding)
+        self.pre = [(a, pre.count(a)) for a in dict.fromkeys(pre)]  # (atom, copies needed)
+        self.preneg = action.ground_atoms("preneg", binding)
+        self.add = action.ground_atoms("add", binding)
+        self.delete = action.ground_atoms("del", binding)
+        self.touched = list(dict.fromkeys(self.delete + self.add))  # Atoms whose count the operator can change.
 
-    def validate_call(self, call: ActionCall, state: list[Predicate]):
-        if self.name != call.name:
-            return False
-        pre: Precondtions = self.preconditions.copy()
-        npre: NegativePrecondtions = self.negative_preconditions.copy()
-        for term_idx in range(len(self.terms)):
-            for p in pre.predicates:
-                for t_idx in range(len(p.terms)):
-                    if p.terms[t_idx].value == self.terms[term_idx].value:
-                        p.terms[t_idx] = call.terms[term_idx]
-            for n in npre.predicates:
-                for t_idx in range(len(n.terms)):
-                    if n.terms[t_idx].value == self.terms[term_idx].value:
-                        n.terms[t_idx] = call.terms[term_idx]
-
-        for p in pre.predicates:
-            pre_list = [x for x in pre.predicates if x == p]
-            s_list = [x for x in state if x == p]
-            if len(pre_list) > len(s_list):
+    def __str__(self):
+        return f"{self.name} {' '.join([str(term) for term in self.terms])}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def applicable(self, counts: tuple) -> bool:
+        for a, n in self.pre:
+            if counts[a] < n:
                 return False
-        for p in npre.predicates:
-            if p in state:
+        for a in self.preneg:
+            if counts[a] > 0:
                 return False
         return True
 
-    def apply_action(self, state: State, call: ActionCall, plus: bool = False):
-        new_state = state.copy()
-        subbed_add = self.add.copy()
-        subbed_del = self.delete.copy()
-        for t_idx in range(len(self.terms)):
-            for a in subbed_add.predicates:
-                for pt_idx in range(len(a.terms)):
-                    if self.terms[t_idx] == a.terms[pt_idx]:
-                        a.terms[pt_idx] = call.terms[t_idx]
-            for d in subbed_del.predicates:
-                for pt_idx in range(len(d.terms)):
-                    if self.terms[t_idx] == d.terms[pt_idx]:
-                        d.terms[pt_idx] = call.terms[t_idx]
-
-        if not plus:
-            for p in subbed_del.predicates:
-                new_state.preds.remove(p)
-        for a in subbed_add.predicates:
-            new_state.preds.append(a.copy())
-        new_state.cost += 1
-        new_state.source_action_call = call
-        return new_state
+    def call(self, source_state: State = None) -> ActionCall:
+        return ActionCall(self.name, self.terms, source_state)
+
+    def successor(self, counts: tuple) -> tuple:
+        caps = self.world.atom_caps
+        counts = list(counts)
+        for d in self.delete:
+            counts[d] -= 1
+        for a in self.add:
+            if counts[a] < caps[a]:
+                counts[a] += 1
+        return tuple(counts)
+
+    def apply(self, state: State) -> State:
+        return State(self.successor(state.counts), self.world, state.cost + 1, self.call(state))
+
+
+class SuccessorGenerator:
+    def __init__(self, operators: list[Operator], initial_counts: tuple):
+        self.operators = operators
+        self.unwatched = []
+        self.watches = {}  # atom -> [(copies needed, operator index)] sorted by copies
+        for i, op in enumerate(operators):
+            if len(op.pre) == 0:
+                self.unwatched.append(i)
+                continue
+            # Watch the precondition furthest from the initial state, it is the least likely to hold.
+            a, n = max(op.pre, key=lambda p: p[1] - initial_counts[p[0]])
+            self.watches.setdefault(a, []).append((n, i))
+        for watch in self.watches.values():
+            watch.sort()
+
+    def applicable(self, counts: tuple) -> list[Operator]:
+        candidates = self.unwatched.copy()
+        for a, watch in self.watches.items():
+            c = counts[a]
+            for n, i in watch:
+                if n > c:
+                    break
+                candidates.append(i)
+        candidates.sort()  # Keep operator order so ties between children break the same way.
+        return [self.operators[i] for i in candidates if self.operators[i].applicable(counts)]
+
+
+class RelaxedPlanningGraph:
+    # Delete relaxation over counted facts, fact (a, k) holds while atom a has at least k copies.
+    # Negative preconditions are ignored and an operator adding m copies of a lifts (a, k) to (a, k + m),
+    # so repeated moves can build up the LFree/RFree/... counts that Checkers positions are made of.
+    def __init__(self, wrl):
+        self.need = [1] * len(wrl.symbols)  # Highest level of each atom anything asks for.
+        for op in wrl.operators:
+            for a, n in op.pre:
+                self.need[a] = max(self.need[a], n)
+        for a in wrl.goal_atoms:
+            self.need[a] = max(self.need[a], wrl.goal_state.counts[a])
+        self.offset = []
+        self.fact_atom = []
+        self.fact_level = []
+        for a in range(len(self.need)):
+            self.offset.append(len(self.fact_atom))
+            for k in range(1, self.need[a] + 1):
+                self.fact_atom.append(a)
+                self.fact_level.append(k)
+
+        self.pre_facts = [[self.fact(a, n) for a, n in op.pre] for op in wrl.operators]
+        self.adds = [[(a, op.add.count(a)) for a in dict.fromkeys(op.add)] for op in wrl.operators]
+        self.waiting = [len(pre) for pre in self.pre_facts]
+        self.triggers = [[] for _ in self.fact_atom]
+        for o, pre in enumerate(self.pre_facts):
+            for f in pre:
+                self.triggers[f].append(o)
+        self.unconditional = [o for o, pre in enumerate(self.pre_facts) if len(pre) == 0]
+        self.goal_facts = [self.fact(a, wrl.goal_state.counts[a]) for a in dict.fromkeys(wrl.goal_atoms)]
+
+    def fact(self, atom: int, level: int) -> int:
+        return self.offset[atom] + level - 1
+
+    def evaluate(self, counts: tuple, additive: bool, supporters: Optional[list] = None) -> list[float]:
+        # Generalized Dijkstra, returns the cost of every fact it settled before all goal facts were settled.
+        cost = [float("inf")] * len(self.fact_atom)
+        reached = [0] * len(self.need)
+        waiting = self.waiting.copy()
+        op_cost = [0] * len(waiting)
+        fired = {}  # atom -> [(operator, copies added)] for operators that are already reachable
+        goals = set(self.goal_facts)
+        heap = []
+
+        def fire(o: int):
+            op_cost[o] += 1
+            for a, m in self.adds[o]:
+                fired.setdefault(a, []).append((o, m))
+                for j in range(reached[a] + 1):
+                    base = 0 if j == 0 else cost[self.fact(a, j)]
+                    c = op_cost[o] + base if additive else max(op_cost[o], base + 1)
+                    heappush(heap, (c, self.fact(a, min(j + m, self.need[a])), o, j))
+
+        for a in range(len(self.need)):
+            if counts[a] > 0:
+                heappush(heap, (0, self.fact(a, min(counts[a], self.need[a])), None, 0))
+        for o in self.unconditional:
+            fire(o)
+        while len(heap) > 0 and len(goals) > 0:
+            c, f, o, source = heappop(heap)
+            a = self.fact_atom[f]
+            for j in range(reached[a] + 1, self.fact_level[f] + 1):  # Lower levels come for free.
+                settled = self.fact(a, j)
+                cost[settled] = c
+                if supporters is not None:
+                    supporters[settled] = (o, self.fact(a, source) if source > 0 else None)
+                goals.discard(settled)
+                for t in self.triggers[settled]:
+                    waiting[t] -= 1
+                    op_cost[t] = op_cost[t] + c if additive else max(op_cost[t], c)
+                    if waiting[t] == 0:
+                        fire(t)
+                for t, m in fired.get(a, []):
+                    step = op_cost[t] + c if additive else max(op_cost[t], c + 1)
+                    heappush(heap, (step, self.fact(a, min(j + m, self.need[a])), t, j))
+                reached[a] = j
+        return cost
+
+    def hmax(self, counts: tuple) -> float:
+        cost = self.evaluate(counts, False)
+        return max([cost[f] for f in self.goal_facts], default=0)
+
+    def hadd(self, counts: tuple) -> float:
+        cost = self.evaluate(counts, True)
+        return sum([cost[f] for f in self.goal_facts])
+
+    def hff(self, counts: tuple) -> float:
+        supporters = [None] * len(self.fact_atom)
+        cost = self.evaluate(counts, True, supporters)
+        if max([cost[f] for f in self.goal_facts], default=0) == float("inf"):
+            return float("inf")
+        plan = set()
+        stack = list(self.goal_facts)
+        seen = set(stack)
+        while len(stack) > 0:
+            f = stack.pop()
+            if cost[f] == 0:
+                continue
+            o, source = supporters[f]
+            plan.add((o, source))  # One application per operator and level it was applied from.
+            for p in self.pre_facts[o] + ([] if source is None else [source]):
+                if p not in seen:
+                    seen.add(p)
+                    stack.append(p)
+        return len(plan)
+
+
+class ParseError(ValueError):
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"line {line}, column {column}: {message}")
+        self.line = line
+        self.column = column
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    # Filled in by a search passed stats=, repeated searches add up. Times are seconds per phase, "ground" is the
+    # World's one-off grounding and compile time.
+    phases = ["ground", "applicable", "successors", "heuristic", "open_list"]
+
+    def __init__(self):
+        self.times = {p: 0.0 for p in self.phases}
+        self.searches = 0
+        self.elapsed = 0.0
+        self.generated = 0
+        self.expanded = 0
+        self.duplicates = 0  # Children already reached at least as cheaply.
+        self.reopened = 0  # Children reached again by a cheaper path.
+        self.evaluations = 0
+        self.peak_open = 0
+        self.peak_closed = 0
+        self.started = None
+
+    def begin(self, wrl):
+        self.times["ground"] = wrl.ground_time
+        self.started = perf_counter()
+
+    def end(self, generated: int, expanded: int):
+        self.elapsed += perf_counter() - self.started
+        self.searches += 1
+        self.generated += generated
+        self.expanded += expanded
+
+    def as_dict(self) -> dict:
+        return {"times": dict(self.times), "searches": self.searches, "elapsed": self.elapsed,
+                "generated": self.generated, "expanded": self.expanded, "duplicates": self.duplicates,
+                "reopened": self.reopened, "evaluations": self.evaluations, "peak_open": self.peak_open,
+                "peak_closed": self.peak_closed,
+                "nodes_per_second": self.expanded / self.elapsed if self.elapsed > 0 else 0.0,
+                "generated_per_second": self.generated / self.elapsed if self.elapsed > 0 else 0.0}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+
+class StreamParser:
+    SECTIONS = ["pre:", "preneg:", "del:", "add:"]
+    PREDICATE = re.compile(r"\s*([\w-]+)\s*\(\s*([\w-]+(?:\s*,\s*[\w-]+)*)\s*\)")
+    PREDICATE_LIST = re.compile(rf"(?:{PREDICATE.pattern})*\s*")
+    COMMA = re.compile(r"\s*,\s*")
+
+    def __init__(self):
+        self.predicates = []
+        self.constants = []
+        self.actions = []
+        self.initial = []
+        self.goal = []
+        self.action = None  # Action whose section lines are still being read.
+        self.section = 0
+        self.line_no = 0
+
+    def feed(self, line: str):
+        self.line_no += 1
+        line = line.rstrip("\r\n")
+        stripped = line.lstrip()
+        col = len(line) - len(stripped)
+        if stripped == "" or stripped[0] == "#":
+            return
+        if self.action is not None:
+            keyword = self.SECTIONS[self.section]
+            if not stripped.startswith(keyword):
+                raise ParseError(f"expected '{keyword}' in action {self.action.name}", self.line_no, col + 1)
+            part = [self.action.preconditions, self.action.negative_preconditions,
+                    self.action.delete, self.action.add][self.section]
+            part.predicates = self.read_predicates(line, col + len(keyword))
+            self.section += 1
+            if self.section == len(self.SECTIONS):
+                self.actions.append(self.action)
+                self.action = None
+        elif stripped.startswith("predicates:"):
+            self.predicates.extend(self.read_predicates(line, col + 11))
+        elif stripped.startswith("constants:"):
+            self.constants.extend([Constant(c) for c in self.read_names(line, col + 10)])
+        elif stripped.startswith("initial:"):
+            self.initial.extend(self.read_predicates(line, col + 8))
+        elif stripped.startswith("goal:"):
+            self.goal.extend(self.read_predicates(line, col + 5))
+        elif stripped[0].isdigit():
+            return  # "<n> actions" count line.
+        elif stripped[0].isupper():
+            names = self.read_names(line, col)
+            self.action = Action(names[0])
+            self.action.terms = [Variable(v) for v in names[1:]]
+            self.action.preconditions = Precondtions()
+            self.action.negative_preconditions = NegativePrecondtions()
+            self.action.delete = DeleteActions()
+            self.action.add = AddActions()
+            self.section = 0
+        else:
+            raise ParseError(f"unexpected line '{stripped}'", self.line_no, col + 1)
+
+    def world(self):
+        if self.action is not None:
+            raise ParseError(f"action {self.action.name} ends before '{self.SECTIONS[self.section]}'",
+                             self.line_no + 1, 1)
+        return World.from_objects(self.predicates, self.constants, self.actions, self.initial, self.goal)
+
+    def read_name(self, line: str, pos: int) -> tuple[str, int]:
+        start = pos
+        while pos < len(line) and (line[pos].isalnum() or line[pos] in "_-"):
+            pos += 1
+        if pos == start:
+            found = f"'{line[pos]}'" if pos < len(line) else "end of line"
+            raise ParseError(f"expected a name, found {found}", self.line_no, pos + 1)
+        return line[start:pos], pos
+
+    def read_names(self, line: str, pos: int) -> list[str]:
+        names = []
+        while True:
+            while pos < len(line) and line[pos].isspace():
+                pos += 1
+            if pos == len(line):
+                return names
+            name, pos = self.read_name(line, pos)
+            names.append(name)
+
+    def expect(self, line: str, pos: int, char: str) -> int:
+        while pos < len(line) and line[pos].isspace():
+            pos += 1
+        if pos == len(line) or line[pos] != char:
+            found = f"'{line[pos]}'" if pos < len(line) else "end of line"
+            raise ParseError(f"expected '{char}', found {found}", self.line_no, pos + 1)
+        return pos + 1
+
+    def read_predicates(self, line: str, pos: int) -> list[Predicate]:
+        preds = []
+        if self.PREDICATE_LIST.fullmatch(line, pos):
+            for name, args in self.PREDICATE.findall(line, pos):
+                p = Predicate(name)
+                p.terms = [Constant(t) if t[0].isupper() else Variable(t) for t in self.COMMA.split(args)]
+                preds.append(p)
+            return preds
+        while True:  # Malformed somewhere, scan by hand to find out where.
+            while pos < len(line) and line[pos].isspace():
+                pos += 1
+            if pos == len(line):
+                return preds
+            name, pos = self.read_name(line, pos)
+            p = Predicate(name)
+            pos = self.expect(line, pos, "(")
+            while True:
+                while pos < len(line) and line[pos].isspace():
+                    pos += 1
+                term, pos = self.read_name(line, pos)
+                p.terms.append(Constant(term) if term[0].isupper() else Variable(term))
+                while pos < len(line) and line[pos].isspace():
+                    pos += 1
+                if pos < len(line) and line[pos] == ")":
+                    pos += 1
+                    break
+                if pos == len(line) or line[pos] != ",":
+                    found = f"'{line[pos]}'" if pos < len(line) else "end of line"
+                    raise ParseError(f"expected ',' or ')', found {found}", self.line_no, pos + 1)
+                pos += 1
+            preds.append(p)
 
 
 class World:
@@ -339,11 +1145,113 @@ class World:
                  actions: list[Token],
                  inital_state: list[Token],
                  goal_state: list[Token]):
-        self.predicates = [self.objectify(p) for p in predicates]
-        self.constants = [self.objectify(c) for c in constants]
-        self.actions = [self.objectify(a) for a in actions]
-        self.inital_state = State([self.objectify(i_s) for i_s in inital_state], self, 0)
-        self.goal_state = State([self.objectify(g_s) for g_s in goal_state], self, -1)
+        self.build([self.objectify(p) for p in predicates],
+                   [self.objectify(c) for c in constants],
+                   [self.objectify(a) for a in actions],
+                   [self.objectify(i_s) for i_s in inital_state],
+                   [self.objectify(g_s) for g_s in goal_state])
+
+    @classmethod
+    def from_objects(cls,
+                     predicates: list[Predicate],
+                     constants: list[Constant],
+                     actions: list[Action],
+                     inital_state: list[Predicate],
+                     goal_state: list[Predicate]) -> Self:
+        # Same World the token constructor gives, for callers that already hold the objects.
+        wrl = cls.__new__(cls)
+        for a in actions:
+            a.world = wrl
+        wrl.build(predicates, constants, actions, inital_state, goal_state)
+        return wrl
+
+    @classmethod
+    def read(cls, stream: Iterable[str]) -> Self:
+        # Parses line by line from any iterable of lines, e.g. an open file or stdin.
+        parser = StreamParser()
+        for line in stream:
+            parser.feed(line)
+        return parser.world()
+
+    def build(self,
+              predicates: list[Predicate],
+              constants: list[Constant],
+              actions: list[Action],
+              initial_preds: list[Predicate],
+              goal_preds: list[Predicate]):
+        start = perf_counter()
+        self.predicates = predicates
+        self.constants = constants
+        self.actions = actions
+
+        self.symbols = SymbolTable()
+        for c in self.constants:
+            self.symbols.constant(c.value)
+        initial_atoms = [self.symbols.grounded(p) for p in initial_preds]
+        self.goal_atoms = [self.symbols.grounded(p) for p in goal_preds]
+        self.operators = []
+        for a in self.actions:
+            a.compile_templates()
+            for terms in product(self.constants, repeat=len(a.terms)):
+                self.operators.append(Operator(a, list(terms), self.symbols.binding(terms)))
+
+        count_caps = self.monotone_count_caps(goal_preds)
+        self.atom_caps = [count_caps.get(p.name, float("inf")) for p in self.symbols.atoms]
+        self.inital_state = State(self.count_atoms(initial_atoms), self, 0)
+        self.goal_state = State(self.count_atoms(self.goal_atoms), self, -1)
+        self.goal_copies = [0] * len(self.symbols)  # How often each atom appears in the goal.
+        for a in self.goal_atoms:
+            self.goal_copies[a] += 1
+        # Like fingerprint without the operators, replace_actions() leaves it alone.
+        self.goal_fingerprint = hash((tuple(str(p) for p in self.symbols.atoms), self.goal_state.counts))
+        self.successor_cache = None  # Set to a dict to remember the applicable operators of every expanded state.
+        self.successor_cache_size = 1 << 18  # Past this many states the oldest entries are dropped.
+        self.compile_operators()
+        self.ground_time = perf_counter() - start
+
+    def compile_operators(self):
+        self.successor_generator = SuccessorGenerator(self.operators, self.inital_state.counts)
+        self.relaxed = RelaxedPlanningGraph(self)
+        # Identifies the grounded task, so cached heuristic values can be shared by Worlds built from the same input.
+        self.fingerprint = hash((tuple(str(p) for p in self.symbols.atoms), self.goal_state.counts,
+                                 tuple((op.name, tuple(op.pre), tuple(op.preneg), tuple(op.add), tuple(op.delete))
+                                       for op in self.operators)))
+
+    def replace_actions(self, removed: list[str], added: list[Action]):
+        # Swaps action schemas in place, keeping atom ids, so states and cached expansions stay valid.
+        atom_count = len(self.symbols)
+        new_ops = []
+        for a in added:
+            a.world = self
+            a.compile_templates()
+            for terms in product(self.constants, repeat=len(a.terms)):
+                new_ops.append(Operator(a, list(terms), self.symbols.binding(terms)))
+        if len(self.symbols) != atom_count:
+            raise ValueError("Replacement actions mention atoms the World was not built with")
+        self.actions = [a for a in self.actions if a.name not in removed] + added
+        self.operators = [op for op in self.operators if op.name not in removed] + new_ops
+        self.compile_operators()
+        if self.successor_cache is not None:
+            order = {op: i for i, op in enumerate(self.operators)}
+            for counts, ops in self.successor_cache.items():
+                kept = [op for op in ops if op.name not in removed] + [op for op in new_ops if op.applicable(counts)]
+                self.successor_cache[counts] = sorted(kept, key=lambda op: order[op])
+
+    def reroot(self, counts: tuple):
+        # Starts later searches from counts and forgets cached expansions that can no longer be reached.
+        self.inital_state = State(counts, self, 0)
+        if self.successor_cache is None:
+            return
+        reachable = {counts}
+        frontier = [counts]
+        while len(frontier) > 0:
+            parent = frontier.pop()
+            for op in self.successor_cache.get(parent, []):
+                child = op.successor(parent)
+                if child not in reachable:
+                    reachable.add(child)
+                    frontier.append(child)
+        self.successor_cache = {k: v for k, v in self.successor_cache.items() if k in reachable}
 
     @staticmethod
     def parse_predicate(token: Token):
@@ -469,22 +1377,158 @@ class World:
             a.delete = self.objectify(tk.children[4], a)
             return a
 
-    def get_action_by_name(self, action_name: str) -> Optional[Action]:
-        for a in self.actions:
-            if a.name == action_name:
-                return a
-        return
+    def monotone_count_caps(self, goal_preds: list[Predicate]) -> dict[str, int]:
+        # Predicates no action deletes only ever grow, e.g. King can add Kinged(piece) again and again.
+        # Past the largest count any precondition or goal asks for the extra copies change nothing,
+        # so they are clamped there to keep the state space finite.
+        deleted = {p.name for a in self.actions for p in a.delete.predicates}
+        caps = {p.name: 1 for a in self.actions for p in a.add.predicates if p.name not in deleted}
+        for preds in [a.preconditions.predicates for a in self.actions] + [goal_preds]:
+            for p in preds:
+                if p.name in caps:
+                    caps[p.name] = max(caps[p.name], len([x for x in preds if x.name == p.name]))
+        return caps
+
+    def count_atoms(self, atoms: list[int]) -> tuple:
+        counts = [0] * len(self.symbols)
+        for a in atoms:
+            counts[a] = min(counts[a] + 1, self.atom_caps[a])
+        return tuple(counts)
+
+    def goal_reached(self, counts) -> bool:
+        for a in self.goal_atoms:
+            if counts[a] < self.goal_state.counts[a]:
+                return False
+        return True
+
+    def goal_counters(self, counts: tuple) -> tuple[int, int]:
+        # (goal atoms with fewer copies than the goal needs, goal literals with no copy at all). The goal is
+        # reached when the first is 0, the second is hlits.
+        needed = self.goal_state.counts
+        unmet = 0
+        missing = 0
+        for a in dict.fromkeys(self.goal_atoms):
+            if counts[a] < needed[a]:
+                unmet += 1
+            if counts[a] == 0:
+                missing += self.goal_copies[a]
+        return unmet, missing
+
+    def child_goal_counters(self, op: Operator, counts: tuple, child: tuple, goals: tuple) -> tuple[int, int]:
+        # goal_counters(child) from the parent's, only the atoms op touched can have changed.
+        unmet, missing = goals
+        needed = self.goal_state.counts
+        for a in op.touched:
+            if self.goal_copies[a] > 0 and counts[a] != child[a]:
+                unmet += (child[a] < needed[a]) - (counts[a] < needed[a])
+                missing += self.goal_copies[a] * ((child[a] == 0) - (counts[a] == 0))
+        return unmet, missing
+
+    def state_goal_counters(self, s: State) -> tuple[int, int]:
+        if s.goals is None:
+            s.goals = self.goal_counters(s.counts)
+        return s.goals
+
+    def hdastar(self, heuristic: Callable, weight: float, workers: Optional[int] = None, batch: int = 64):
+        # Hash distributed A*: each state lives in the worker hash(counts) % workers, which scores, stores and
+        # expands it. Nodes travel between workers in batches and the search ends once no worker has anything
+        # cheaper than the best plan left and no batch is in flight. Returns what wastar returns.
+        workers = workers or cpu_count() or 1
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(workers)]
+        replies = context.Queue()
+        processes = [context.Process(target=hda_worker, args=(self, i, inboxes, replies, heuristic, weight, batch),
+                                     daemon=True) for i in range(workers)]
+        for p in processes:
+            p.start()
+        try:
+            root = self.inital_state.counts
+            inboxes[hash(root) % workers].put(("nodes", [(root, 0, None, None)]))
+            sent = 1  # Node batches put by this process, the workers count the rest.
+            incumbent = float("inf")
+            goal = None
+            idle = [None] * workers
+            fresh = False  # An idle report came in since the last wave started.
+            wave = 0
+            acks = {}
+            last_totals = None
+            while True:
+                msg = collect(replies, processes)
+                if msg[0] == "goal":
+                    if msg[1] < incumbent:
+                        incumbent, goal = msg[1], msg[2]
+                        for inbox in inboxes:
+                            inbox.put(("bound", incumbent))
+                elif msg[0] == "idle":
+                    idle[msg[1]] = msg[2:]
+                    fresh = True
+                elif msg[0] == "ack" and msg[1] == wave:
+                    acks[msg[2]] = msg[3:]
+                    if len(acks) == workers:
+                        totals = (sent + sum(a[0] for a in acks.values()), sum(a[1] for a in acks.values()))
+                        done = all(a[2] for a in acks.values()) and totals[0] == totals[1]
+                        if done and totals == last_totals:  # Two quiet waves in a row, nothing moved in between.
+                            break
+                        last_totals = totals if done else None
+                        acks = {}
+                        if done:
+                            wave += 1
+                            for inbox in inboxes:
+                                inbox.put(("probe", wave))
+                        continue
+                if fresh and len(acks) == 0 and all(i is not None for i in idle) \
+                        and sent + sum(i[0] for i in idle) == sum(i[1] for i in idle):
+                    wave += 1
+                    fresh = False
+                    for inbox in inboxes:
+                        inbox.put(("probe", wave))
+            generated = sum(a[3] for a in acks.values())
+            expanded = sum(a[4] for a in acks.values())
+            if goal is None:
+                return None
+            path = []
+            counts = goal
+            while True:
+                inboxes[hash(counts) % workers].put(("trace", counts))
+                msg = collect(replies, processes)
+                while msg[0] != "parent":
+                    msg = collect(replies, processes)
+                if msg[1] is None:
+                    break
+                path.append(msg[2])
+                counts = msg[1]
+            path.reverse()
+            return self.replay(path), generated, expanded
+        finally:
+            for inbox in inboxes:
+                inbox.put(("stop",))
+            for p in processes:
+                p.join(1)
+                if p.is_alive():
+                    p.terminate()
+
+    def operator_path(self, state: State) -> list[int]:
+        # The plan leading to state as indexes into self.operators, small enough to send between processes.
+        index = {(op.name, tuple(str(t) for t in op.terms)): i for i, op in enumerate(self.operators)}
+        return [index[(step.name, tuple(str(t) for t in step.terms))] for step in state.plan()]
+
+    def replay(self, path: list[int]) -> State:
+        state = self.inital_state
+        for i in path:
+            state = self.operators[i].apply(state)
+        return state
+
+    def applicable(self, counts: tuple) -> list[Operator]:
+        if self.successor_cache is None:
+            return self.successor_generator.applicable(counts)
+        if counts not in self.successor_cache:
+            if len(self.successor_cache) >= self.successor_cache_size:
+                del self.successor_cache[next(iter(self.successor_cache))]
+            self.successor_cache[counts] = self.successor_generator.applicable(counts)
+        return self.successor_cache[counts]
 
     def ground(self, cur_state: State, print_calls=False) -> list[ActionCall]:
-        calls = []
-        valid_calls = []
-        for a in self.actions:
-            calls.extend(a.ground(self.constants))
-        for c in calls:
-            if self.get_action_by_name(c.name).validate_call(c, cur_state.preds):
-                valid_calls.append(c)
-        for vc in valid_calls:
-            vc.source_state = cur_state
+        valid_calls = [op.call(cur_state) for op in self.applicable(cur_state.counts)]
         if print_calls:
             for c in valid_calls:
                 print(c)
@@ -492,55 +1536,763 @@ class World:
                 print("No actions")
         return valid_calls
 
-    def wastar(self, heuristic: Callable, weight: float):
-        open_nodes = [self.inital_state]
-        closed = []
+    def wastar(self, heuristic: Callable, weight: float, deadline: Optional[float] = None,
+               bound: float = float("inf"), pool: Optional["HeuristicPool"] = None,
+               stats: Optional[SearchStats] = None, checkpoint: Optional[Checkpoint] = None):
+        # deadline is a perf_counter() time, past it SearchTimeout is raised. Paths costing bound or more are pruned.
+        # With a pool, each expansion's new children are scored together in its worker processes.
+        # Without stats the only instrumentation cost is a few skipped branches per expansion.
+        # With a checkpoint the run continues from the checkpoint's file if there is one and snapshots itself there.
+        timing = stats is not None
+        if timing:
+            stats.begin(self)
+        resumed = checkpoint.load(self, heuristic, weight) if checkpoint is not None else None
+        if resumed is not None:
+            nodes, open_nodes, open_entries, best, generated, expanded = resumed
+        else:
+            nodes = NodeStore(self)
+            root = nodes.add(nodes.pack(self.inital_state.counts), -1, -1, self.inital_state.cost,
+                             self.goal_counters(self.inital_state.counts))
+            open_nodes = OpenList()
+            open_entries = {nodes.keys[root]: open_nodes.push(root, 0)}
+            best = {nodes.keys[root]: root}  # Packed counts -> node of the cheapest known path.
+            generated = 0
+            expanded = 0
+        try:
+            while True:
+                if len(open_nodes) == 0:
+                    return
+                if deadline is not None and perf_counter() > deadline:
+                    if checkpoint is not None:
+                        checkpoint.save(self, heuristic, weight, nodes, open_nodes, generated, expanded)
+                    raise SearchTimeout()
+                if checkpoint is not None and checkpoint.due():
+                    checkpoint.save(self, heuristic, weight, nodes, open_nodes, generated, expanded)
+                if timing:
+                    t0 = perf_counter()
+                node = open_nodes.pop()
+                del open_entries[nodes.keys[node]]
+                counts = nodes.counts(node)
+                if timing:
+                    t1 = perf_counter()
+                    stats.times["open_list"] += t1 - t0
+                if nodes.unmet[node] == 0:
+                    return nodes.subset([node])[0], generated, expanded
+                else:
+                    ops = self.applicable(counts)
+                    generated += len(ops)
+                    cost = nodes.costs[node] + 1
+                    fresh = []
+                    if timing:
+                        t2 = perf_counter()
+                        stats.times["applicable"] += t2 - t1
+                        seen = len(best)
+                    if cost < bound:
+                        fresh = self.improved_children(nodes, node, counts, ops, best, open_nodes, open_entries)
+                    children = [State(child, self, cost, goals=nodes.goals(n)) for n, child in fresh]
+                    if timing:
+                        t3 = perf_counter()
+                        stats.times["successors"] += t3 - t2
+                        if cost < bound:
+                            stats.duplicates += len(ops) - len(fresh)
+                            stats.reopened += len(fresh) - (len(best) - seen)
+                    scores = pool.score(self, children) if pool is not None else [heuristic(self, c) for c in children]
+                    if timing:
+                        t4 = perf_counter()
+                        stats.times["heuristic"] += t4 - t3
+                        stats.evaluations += len(children)
+                    for (n, _), h in zip(fresh, scores):
+                        open_entries[nodes.keys[n]] = open_nodes.push(n, cost + weight * h)
+                    expanded += 1
+                    if timing:
+                        stats.times["open_list"] += perf_counter() - t4
+                        stats.peak_open = max(stats.peak_open, len(open_nodes))
+                        stats.peak_closed = max(stats.peak_closed, len(best) - len(open_entries))
+        finally:
+            if timing:
+                stats.end(generated, expanded)
+
+    def improved_children(self, nodes: NodeStore, node: int, counts: tuple, ops: list, best: dict,
+                          open_nodes: OpenList, open_entries: dict) -> list[tuple[int, tuple]]:
+        # Stores the children of node reached for the first time or more cheaply than before, returning
+        # (child node, counts) for each. Cheaper paths replace the old open entry.
+        cost = nodes.costs[node] + 1
+        goals = nodes.goals(node)
+        fresh = []
+        for op in ops:
+            child = op.successor(counts)
+            key = nodes.pack(child)
+            known = best.get(key)
+            if known is None or cost < nodes.costs[known]:
+                if key in open_entries:
+                    open_nodes.remove(open_entries.pop(key))
+                best[key] = nodes.add(key, node, nodes.op_index[op], cost,
+                                      self.child_goal_counters(op, counts, child, goals))
+                fresh.append((best[key], child))
+        return fresh
+
+    def anytime_wastar(self, heuristic: Callable, weights: list[float], deadline: float,
+                       pool: Optional["HeuristicPool"] = None, stats: Optional[SearchStats] = None):
+        # Restarting weighted A*: one run per weight, each only looking for plans cheaper than the best so far.
+        # Returns the best (state, generated, expanded) found by the deadline, None if there was none.
+        best = None
+        for weight in weights:
+            try:
+                bound = best[0].cost if best is not None else float("inf")
+                result = self.wastar(heuristic, weight, deadline, bound, pool, stats)
+            except SearchTimeout:
+                break
+            if result is None:  # Nothing cheaper exists.
+                break
+            best = result
+        return best
+
+    def partial_wastar(self, heuristic: Callable, inv_heuristic: Callable, weight: float, depth: int,
+                       deadline: Optional[float] = None, pool: Optional["HeuristicPool"] = None,
+                       stats: Optional[SearchStats] = None, tree: Optional[SearchTree] = None):
+        # With a tree the search goes on from what earlier calls left there, first re-rooted at the current initial
+        # state, and leaves its own progress there too, also when it times out.
+        keep = tree is not None
+        if not keep:
+            tree = SearchTree(self, heuristic, weight)
+        elif tree.heuristic is not heuristic or tree.weight != weight:
+            raise ValueError("The search tree was grown with another heuristic or weight")
+        tree.follow(self)
+        timing = stats is not None
+        if timing:
+            stats.begin(self)
+        nodes, open_nodes, open_entries, best, closed = tree.nodes, tree.open_nodes, tree.open_entries, tree.best, \
+            tree.closed
+        too_deep = any(nodes.costs[n] > depth for n in closed.values())
         generated = 0
-        expanded = 0
-        while True:
-            if len(open_nodes) == 0 or open_nodes[0] is None:
+        try:
+            while True:
+                if len(open_nodes) == 0 or too_deep:
+                    out = nodes.subset([n for n in closed.values() if depth == nodes.costs[n]])
+                    out.sort(key=lambda x: x.cost + weight * inv_heuristic(self, x))
+                    return out
+                if deadline is not None and perf_counter() > deadline:
+                    raise SearchTimeout()
+                if timing:
+                    t0 = perf_counter()
+                node = open_nodes.pop()
+                key = nodes.keys[node]
+                del open_entries[key]
+                counts = nodes.counts(node)
+                if timing:
+                    t1 = perf_counter()
+                    stats.times["open_list"] += t1 - t0
+                if nodes.unmet[node] == 0:
+                    if keep:  # Back on the open list, so a later call on the same tree finds it first again.
+                        f = nodes.costs[node] + weight * heuristic(self, nodes.state(node))
+                        open_entries[key] = open_nodes.push(node, f if node > 0 else 0)
+                    return nodes.subset([node])
+                else:
+                    cost = nodes.costs[node] + 1
+                    ops = self.applicable(counts)
+                    generated += len(ops)
+                    if timing:
+                        t2 = perf_counter()
+                        stats.times["applicable"] += t2 - t1
+                        seen = len(best)
+                    fresh = self.improved_children(nodes, node, counts, ops, best, open_nodes, open_entries)
+                    for n, _ in fresh:
+                        closed.pop(nodes.keys[n], None)
+                    children = [State(child, self, cost, goals=nodes.goals(n)) for n, child in fresh]
+                    if timing:
+                        t3 = perf_counter()
+                        stats.times["successors"] += t3 - t2
+                        stats.duplicates += len(ops) - len(fresh)
+                        stats.reopened += len(fresh) - (len(best) - seen)
+                    scores = pool.score(self, children) if pool is not None else [heuristic(self, c) for c in children]
+                    if timing:
+                        t4 = perf_counter()
+                        stats.times["heuristic"] += t4 - t3
+                        stats.evaluations += len(children)
+                    for (n, _), h in zip(fresh, scores):
+                        open_entries[nodes.keys[n]] = open_nodes.push(n, cost + weight * h)
+                    closed[key] = node
+                    too_deep = too_deep or nodes.costs[node] > depth
+                    if timing:
+                        stats.times["open_list"] += perf_counter() - t4
+                        stats.peak_open = max(stats.peak_open, len(open_nodes))
+                        stats.peak_closed = max(stats.peak_closed, len(closed))
+        finally:
+            if timing:
+                stats.end(generated, len(closed))
+
+    def external_wastar(self, heuristic: Callable, weight: float, directory: str, budget: int = 256 * 2 ** 20,
+                        deadline: Optional[float] = None, pool: Optional["HeuristicPool"] = None,
+                        stats: Optional[SearchStats] = None):
+        # Weighted A* with open and closed lists on disk in directory, for tasks whose closed list outgrows RAM.
+        # Bucket (g, h) is expanded as a whole, lowest g + weight * h first, and duplicates are dropped then
+        # rather than when a state is generated. Everything needed to go on lives in directory: calling again with
+        # the same task, heuristic and weight resumes an interrupted or timed out search. Returns what wastar
+        # returns, the counts include work done before a resume.
+        buckets = BucketStore(directory, len(self.symbols), budget)
+        task = {"version": BucketStore.version, "task": self.digest(), "weight": weight,
+                "heuristic": heuristic_name(heuristic)}
+        meta = buckets.load()
+        if meta is None:
+            meta = dict(task, generated=0, expanded=0)
+            h = heuristic(self, self.inital_state)
+            if h != float("inf"):
+                buckets.add(0, float(h), NodeStore.pack(self.inital_state.counts), -1, -1.0)
+                buckets.flush()
+            buckets.save(meta)
+        elif any(meta.get(k) != v for k, v in task.items()):
+            raise ValueError(f"{directory} holds a different search")
+        buckets.recover(meta.get("partial"))
+        op_index = {op: i for i, op in enumerate(self.operators)}
+        generated = meta["generated"]
+        expanded = meta["expanded"]
+        timing = stats is not None
+        if timing:
+            stats.begin(self)
+        try:
+            while True:
+                waiting = buckets.buckets("open")
+                if len(waiting) == 0:
+                    return
+                # A bucket a deadline stopped is finished first, so nothing can add to its .open file meanwhile.
+                partial = meta.pop("partial", None)
+                if partial is not None:
+                    g, h = partial[0], partial[1]
+                else:
+                    g, h = min(waiting, key=lambda b: (b[0] + weight * b[1], b[1], b[0]))
+                with open(buckets.file(g, h, "fresh"), "ab" if partial is not None else "wb") as fresh:
+                    for r in buckets.fresh(g, h):
+                        if deadline is not None and perf_counter() > deadline:
+                            fresh.flush()
+                            buckets.flush()
+                            meta["generated"] = generated
+                            meta["expanded"] = expanded
+                            meta["partial"] = [g, h, fresh.tell() // buckets.record.size]
+                            buckets.save(meta)
+                            raise SearchTimeout()
+                        counts = tuple(array("H", r[:buckets.key_size]))
+                        if self.goal_reached(counts):
+                            return self.external_path(buckets, g, r), generated, expanded
+                        fresh.write(r)
+                        if timing:
+                            t1 = perf_counter()
+                        ops = self.applicable(counts)
+                        generated += len(ops)
+                        if timing:
+                            t2 = perf_counter()
+                            stats.times["applicable"] += t2 - t1
+                        children = [State(op.successor(counts), self, g + 1) for op in ops]
+                        if timing:
+                            t3 = perf_counter()
+                            stats.times["successors"] += t3 - t2
+                        if pool is not None:
+                            scores = pool.score(self, children)
+                        else:
+                            scores = [heuristic(self, c) for c in children]
+                        if timing:
+                            t4 = perf_counter()
+                            stats.times["heuristic"] += t4 - t3
+                            stats.evaluations += len(children)
+                        for op, child, score in zip(ops, children, scores):
+                            if score != float("inf"):
+                                buckets.add(g + 1, float(score), NodeStore.pack(child.counts), op_index[op], h)
+                        expanded += 1
+                        if timing:
+                            stats.times["open_list"] += perf_counter() - t4
+                            stats.peak_closed = expanded  # Every expanded record is kept in a .closed file.
+                buckets.flush()
+                buckets.close(g, h)
+                meta["generated"] = generated
+                meta["expanded"] = expanded
+                buckets.save(meta)
+        finally:
+            if timing:
+                stats.end(generated, expanded)
+
+    def external_path(self, buckets: BucketStore, g: int, record: bytes) -> State:
+        # A record only names its operator and its parent's bucket, the parent is the state in that bucket the
+        # operator turns into the record's state. Its bucket is closed unless a resume left it partly expanded.
+        _, op, parent_h = buckets.record.unpack(record)
+        counts = tuple(array("H", record[:buckets.key_size]))
+        path = []
+        while op >= 0:
+            operator = self.operators[op]
+            path.append(operator)
+            g -= 1
+            parent = None
+            for kind in ("closed", "open"):
+                for r in buckets.read(buckets.file(g, parent_h, kind)):
+                    candidate = tuple(array("H", r[:buckets.key_size]))
+                    if operator.applicable(candidate) and operator.successor(candidate) == counts:
+                        parent = r
+                        break
+                if parent is not None:
+                    break
+            if parent is None:
+                raise ValueError(f"{buckets.directory} is missing the parent of a state in bucket {g + 1}")
+            _, op, parent_h = buckets.record.unpack(parent)
+            counts = tuple(array("H", parent[:buckets.key_size]))
+        nodes = NodeStore(self)
+        counts = self.inital_state.counts
+        goals = self.goal_counters(counts)
+        node = nodes.add(nodes.pack(counts), -1, -1, 0, goals)
+        for operator in reversed(path):
+            child = operator.successor(counts)
+            goals = self.child_goal_counters(operator, counts, child, goals)
+            node = nodes.add(nodes.pack(child), node, nodes.op_index[operator], nodes.costs[node] + 1, goals)
+            counts = child
+        return nodes.state(node)
+
+    def digest(self) -> str:
+        # Like fingerprint, but the same in every process (str hashes are salted per process), for files that
+        # outlive a run.
+        task = ([str(p) for p in self.symbols.atoms], self.goal_state.counts, self.inital_state.counts,
+                [(op.name, op.pre, op.preneg, op.add, op.delete) for op in self.operators])
+        return blake2b(repr(task).encode(), digest_size=16).hexdigest()
+
+
+class HeuristicCache:
+    def __init__(self, heuristic: Callable, max_size: int = 100000):
+        self.heuristic = heuristic
+        self.max_size = max_size
+        # Heuristics that only look at the goal atoms keep their values when the operators change.
+        self.goal_only = heuristic in GOAL_HEURISTICS
+        self.values = OrderedDict()  # Least recently used first.
+        self.hits = 0
+        self.misses = 0
+
+    def task_key(self, wrl: World) -> int:
+        return wrl.goal_fingerprint if self.goal_only else wrl.fingerprint
+
+    def __call__(self, wrl: World, s: State):
+        key = (self.task_key(wrl), s.key())
+        if key in self.values:
+            self.hits += 1
+            self.values.move_to_end(key)
+            return self.values[key]
+        self.misses += 1
+        value = self.heuristic(wrl, s)
+        self.values[key] = value
+        if len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"size": len(self.values), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
+
+
+class TranspositionTable:
+    def __init__(self, size: int = 1 << 16):
+        # Fixed number of slots, one entry each. A slot keeps the deeper of two colliding entries.
+        self.size = size
+        self.keys = [None] * size
+        self.depths = [-1] * size
+        self.values = [None] * size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def probe(self, key) -> Optional[tuple[int, object]]:
+        self.probes += 1
+        i = hash(key) % self.size
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.depths[i], self.values[i]
+        return None
+
+    def store(self, key, depth: int, value):
+        i = hash(key) % self.size
+        if self.keys[i] is not None and self.keys[i] != key:
+            if depth < self.depths[i]:
+                self.rejected += 1
                 return
-            state = open_nodes.pop(0)
-            if len([x for x in state.preds if x in self.goal_state.preds]) == len(self.goal_state.preds):
-                return state, generated, expanded
-            else:
-                valid_action_calls = self.ground(state)
-                children = []
-                for call in valid_action_calls:
-                    children.append(self.get_action_by_name(call.name).apply_action(state, call))
-                    generated += 1
-                for child in children:
-                    if child not in closed:
-                        open_nodes.insert(0, child)
-                closed.append(state)
-                expanded += 1
-            open_nodes.sort(key=lambda x: x.cost + weight * heuristic(self, x))
-
-    def partial_wastar(self, heuristic: Callable, inv_heuristic: Callable, weight: float, depth: int):
-        open_nodes = [self.inital_state]
-        closed = []
+            self.overwrites += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.values[i] = value
+        self.stores += 1
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.depths = [-1] * self.size
+        self.values = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        used = self.size - self.keys.count(None)
+        return {"size": self.size, "used": used, "probes": self.probes, "hits": self.hits,
+                "hit_rate": self.hits / self.probes if self.probes > 0 else 0.0, "stores": self.stores,
+                "overwrites": self.overwrites, "rejected": self.rejected}
+
+
+worker_world = None
+worker_heuristic = None
+
+
+def init_worker(wrl: World, heuristic: Callable):
+    # Runs once in every pool process, the World arrives here and is never sent again.
+    global worker_world, worker_heuristic
+    worker_world = wrl
+    worker_heuristic = heuristic
+
+
+def score_packed(typecode: str, packed: bytes) -> list[float]:
+    counts = array(typecode, packed)
+    n = len(worker_world.inital_state.counts)
+    return [worker_heuristic(worker_world, State(tuple(counts[i:i + n]), worker_world, 0))
+            for i in range(0, len(counts), n)]
+
+
+class HeuristicPool:
+    def __init__(self, wrl: World, heuristic: Callable, workers: Optional[int] = None, min_batch: int = 8):
+        # Batches smaller than min_batch are scored here, shipping them would cost more than scoring them.
+        self.world = wrl
+        self.heuristic = heuristic
+        self.fingerprint = wrl.fingerprint
+        self.workers = workers or cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(wrl, heuristic))
+        self.min_batch = min_batch
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def score(self, wrl: World, states: list[State]) -> list[float]:
+        if wrl.fingerprint != self.fingerprint:
+            raise ValueError("HeuristicPool was started with a different World")
+        if len(states) < self.min_batch:
+            return [self.heuristic(wrl, s) for s in states]
+        # States go over as one flat array of counts per worker, bytes when every count fits.
+        typecode = "B" if max(max(s.counts) for s in states) < 256 else "L"
+        per_worker = -(-len(states) // self.workers)
+        futures = []
+        for i in range(0, len(states), per_worker):
+            packed = array(typecode, [c for s in states[i:i + per_worker] for c in s.counts]).tobytes()
+            futures.append(self.executor.submit(score_packed, typecode, packed))
+        return [h for f in futures for h in f.result()]
+
+
+class VectorBackend:
+    # Batch evaluation with numpy: a batch of states is a matrix of counts, one row per state. Drop-in for a
+    # HeuristicPool (score), giving the same values as the pure Python path.
+    def __init__(self, wrl: World, heuristic: Callable):
+        if np is None:
+            raise ImportError("VectorBackend needs numpy")
+        self.world = wrl
+        self.heuristic = heuristic
+        self.fingerprint = wrl.fingerprint
+        goals = list(dict.fromkeys(wrl.goal_atoms))
+        self.goal_atom = np.array(goals, dtype=np.intp)
+        self.goal_copies = np.array([wrl.goal_copies[a] for a in goals])
+        self.relax(wrl.relaxed)
+
+    def relax(self, rpg: RelaxedPlanningGraph):
+        # The relaxed planning graph as arrays. Column len(fact_atom) of a cost matrix is a fact that always costs
+        # 0, it pads short precondition lists and stands in for "no copies" as the level an operator lifts from.
+        self.rpg = rpg
+        zero = len(rpg.fact_atom)
+        self.fact_atom = np.array(rpg.fact_atom, dtype=np.intp)
+        self.fact_level = np.array(rpg.fact_level)
+        width = max([len(p) for p in rpg.pre_facts], default=0) or 1
+        self.pre_facts = np.full((len(rpg.pre_facts), width), zero, dtype=np.intp)
+        for o, p in enumerate(rpg.pre_facts):
+            self.pre_facts[o, :len(p)] = p
+        # Every way an operator can settle a fact, in the order RelaxedPlanningGraph.evaluate's heap breaks ties:
+        # target fact, then operator, then the level it lifts from. Operator o adding m copies of a reaches
+        # level L from level L - m, and the top level from any level m below it, the lowest being the cheapest.
+        entries = []
+        for o, adds in enumerate(rpg.adds):
+            for a, m in adds:
+                for level in range(min(m, rpg.need[a]), rpg.need[a] + 1):
+                    source = max(0, level - m)
+                    entries.append((rpg.fact(a, level), o, rpg.fact(a, source) if source > 0 else zero))
+        entries.sort()
+        self.entry_target = np.array([t for t, _, _ in entries], dtype=np.intp)
+        self.entry_op = np.array([o for _, o, _ in entries], dtype=np.intp)
+        self.entry_source = np.array([s for _, _, s in entries], dtype=np.intp)
+        self.targets, self.target_starts = np.unique(self.entry_target, return_index=True)
+        # First entry reaching fact f or a level above it, and one past the last entry for f's atom.
+        self.entry_from = np.searchsorted(self.entry_target, np.arange(zero)).tolist()
+        self.entry_to = [int(np.searchsorted(self.entry_target, rpg.offset[a] + rpg.need[a])) for a in rpg.fact_atom]
+        # Facts below their atom's top level, by level, for carrying cheaper higher levels down.
+        top = max(rpg.need, default=1)
+        self.lower = [np.array([f for f in range(zero) if rpg.fact_level[f] == level and
+                                rpg.need[rpg.fact_atom[f]] > level], dtype=np.intp) for level in range(top - 1, 0, -1)]
+        self.goal_facts = np.array(rpg.goal_facts, dtype=np.intp)
+
+    def matrix(self, states: list) -> "np.ndarray":
+        return np.array([s.counts if isinstance(s, State) else s for s in states], dtype=np.int64)
+
+    def relaxed_costs(self, counts: "np.ndarray", additive: bool) -> tuple:
+        # Least fixpoint of the relaxed cost equations for every row at once, the costs
+        # RelaxedPlanningGraph.evaluate settles. Returns (fact costs, operator costs).
+        held = counts[:, self.fact_atom] >= self.fact_level
+        cost = np.where(held, 0.0, np.inf)
+        cost = np.hstack([cost, np.zeros((len(counts), 1))])
         while True:
-            if len(open_nodes) == 0 or open_nodes[0] is None:
-                out = [x for x in closed if depth == x.cost]
-                out.sort(key=lambda x: x.cost + weight * inv_heuristic(self, x))
-                return out
-            state = open_nodes.pop(0)
-            if len([x for x in closed if x.cost > depth]) > 0:
-                out = [x for x in closed if depth == x.cost]
-                out.sort(key=lambda x: x.cost + weight * inv_heuristic(self, x))
-                return out
-            elif len([x for x in state.preds if x in self.goal_state.preds]) == len(self.goal_state.preds):
-                return [state]
+            pre = cost[:, self.pre_facts]
+            op_cost = 1 + (pre.sum(axis=2) if additive else pre.max(axis=2))
+            source = cost[:, self.entry_source]
+            if additive:
+                reach = op_cost[:, self.entry_op] + source
             else:
-                valid_action_calls = self.ground(state)
-                children = []
-                for call in valid_action_calls:
-                    children.append(self.get_action_by_name(call.name).apply_action(state, call))
-                for child in children:
-                    if child not in closed:
-                        open_nodes.insert(0, child)
-                closed.append(state)
-            open_nodes.sort(key=lambda x: x.cost + weight * heuristic(self, x))
+                reach = np.maximum(op_cost[:, self.entry_op], source + 1)
+            updated = cost.copy()
+            if len(self.targets) > 0:
+                updated[:, self.targets] = np.minimum(updated[:, self.targets],
+                                                      np.minimum.reduceat(reach, self.target_starts, axis=1))
+            for facts in self.lower:
+                updated[:, facts] = np.minimum(updated[:, facts], updated[:, facts + 1])
+            if np.array_equal(updated, cost):
+                return cost, op_cost
+            cost = updated
+
+    def hmax(self, counts: "np.ndarray") -> list[float]:
+        cost, _ = self.relaxed_costs(counts, False)
+        return [self.value(h) for h in cost[:, self.goal_facts].max(axis=1, initial=0)]
+
+    def hadd(self, counts: "np.ndarray") -> list[float]:
+        cost, _ = self.relaxed_costs(counts, True)
+        return [self.value(h) for h in cost[:, self.goal_facts].sum(axis=1)]
+
+    def hff(self, counts: "np.ndarray") -> list[float]:
+        # Costs come from the batch fixpoint, the relaxed plan is then traced per row like RelaxedPlanningGraph.hff,
+        # each fact supported by the first entry in heap order that reaches it at its cost.
+        costs, op_costs = self.relaxed_costs(counts, True)
+        zero = len(self.rpg.fact_atom)
+        entry_op = self.entry_op.tolist()
+        entry_source = self.entry_source.tolist()
+        out = []
+        for cost, op_cost in zip(costs.tolist(), op_costs.tolist()):
+            if max([cost[f] for f in self.rpg.goal_facts], default=0) == float("inf"):
+                out.append(float("inf"))
+                continue
+            plan = set()
+            stack = list(self.rpg.goal_facts)
+            seen = set(stack)
+            while len(stack) > 0:
+                f = stack.pop()
+                if cost[f] == 0:
+                    continue
+                for e in range(self.entry_from[f], self.entry_to[f]):
+                    o, s = entry_op[e], entry_source[e]
+                    if op_cost[o] + cost[s] == cost[f]:
+                        break
+                source = s if s != zero else None
+                plan.add((o, source))
+                for p in self.rpg.pre_facts[o] + ([] if source is None else [source]):
+                    if p not in seen:
+                        seen.add(p)
+                        stack.append(p)
+            out.append(len(plan))
+        return out
+
+    @staticmethod
+    def value(h: float):
+        return int(h) if h != float("inf") else float("inf")
+
+    def score(self, wrl: World, states: list[State]) -> list[float]:
+        if wrl.fingerprint != self.fingerprint:
+            raise ValueError("VectorBackend was built for a different World")
+        if len(states) == 0:
+            return []
+        if self.heuristic is h0:
+            return [0] * len(states)
+        counts = self.matrix(states)
+        if self.heuristic is hlits or self.heuristic is hlits_inv:
+            missing = (counts[:, self.goal_atom] == 0) @ self.goal_copies
+            if self.heuristic is hlits_inv:
+                missing = len(wrl.goal_atoms) - missing
+            return missing.tolist()
+        if self.heuristic is hmax:
+            return self.hmax(counts)
+        if self.heuristic is hsum:
+            return self.hadd(counts)
+        if self.heuristic is hff:
+            return self.hff(counts)
+        return [self.heuristic(wrl, s) for s in states]
+
+
+def collect(replies, processes: list, timeout: Optional[float] = None):
+    # replies.get() that keeps an eye on the worker processes, so one that died, for example because its
+    # heuristic raised, is reported instead of waited for. Raises queue.Empty once timeout seconds have passed.
+    stop = perf_counter() + timeout if timeout is not None else None
+    while True:
+        wait = min(0.1, max(0.0, stop - perf_counter())) if stop is not None else 0.1
+        try:
+            return replies.get(timeout=wait)
+        except queue.Empty:
+            for i, p in enumerate(processes):
+                if p.exitcode is not None and p.exitcode != 0:
+                    raise RuntimeError(f"Worker process {i} exited with code {p.exitcode}")
+            if stop is not None and perf_counter() >= stop:
+                raise
+
+
+def hda_worker(wrl: World, me: int, inboxes: list, replies, heuristic: Callable, weight: float, batch: int):
+    workers = len(inboxes)
+    index = {op: i for i, op in enumerate(wrl.operators)}
+    open_nodes = OpenList()
+    open_entries = {}
+    best_g = {}
+    parents = {}  # counts -> (parent counts, operator index) of the cheapest known path.
+    incumbent = float("inf")
+    sent = 0
+    received = 0
+    generated = 0
+    expanded = 0
+    outboxes = [[] for _ in range(workers)]
+    reported = False
+    while True:
+        # Block only when there is nothing left to expand here.
+        messages = []
+        try:
+            while True:
+                messages.append(inboxes[me].get(block=len(open_nodes) == 0 and len(messages) == 0))
+        except queue.Empty:
+            pass
+        for msg in messages:
+            if msg[0] == "nodes":
+                received += 1
+                reported = False
+                for counts, g, parent, op in msg[1]:
+                    if g >= best_g.get(counts, float("inf")):
+                        continue
+                    best_g[counts] = g
+                    parents[counts] = (parent, op)
+                    if counts in open_entries:
+                        open_nodes.remove(open_entries[counts])
+                    f = g + weight * heuristic(wrl, State(counts, wrl, g))
+                    open_entries[counts] = open_nodes.push((counts, g), f)
+            elif msg[0] == "bound":
+                incumbent = min(incumbent, msg[1])
+            elif msg[0] == "probe":
+                replies.put(("ack", msg[1], me, sent, received, len(open_nodes) == 0, generated, expanded))
+            elif msg[0] == "trace":
+                parent, op = parents[msg[1]]
+                replies.put(("parent", parent, op))
+            elif msg[0] == "stop":
+                return
+        for _ in range(batch):
+            if len(open_nodes) == 0:
+                break
+            if open_nodes.min_f() >= incumbent:  # Nothing here can beat the best plan any more.
+                open_nodes = OpenList()
+                open_entries = {}
+                break
+            counts, g = open_nodes.pop()
+            del open_entries[counts]
+            if wrl.goal_reached(counts):
+                incumbent = g
+                replies.put(("goal", g, counts))
+                continue
+            expanded += 1
+            for op in wrl.applicable(counts):
+                child = op.successor(counts)
+                generated += 1
+                outboxes[hash(child) % workers].append((child, g + 1, counts, index[op]))
+        for i, out in enumerate(outboxes):
+            if len(out) > 0:
+                inboxes[i].put(("nodes", out))
+                sent += 1
+                outboxes[i] = []
+        if len(open_nodes) == 0 and not reported:
+            replies.put(("idle", me, sent, received))
+            reported = True
+
+
+def portfolio_worker(wrl: World, i: int, heuristic: Callable, weight: float, results):
+    # Posts (i, path, generated, expanded) for the first plan and every cheaper one its restarts find,
+    # then (i, None, 0, 0) once nothing cheaper can exist.
+    bound = float("inf")
+    for w in anytime_weights(weight):
+        result = wrl.wastar(heuristic, w, bound=bound)
+        if result is None:
+            break
+        bound = result[0].cost
+        results.put((i, wrl.operator_path(result[0]), result[1], result[2]))
+    results.put((i, None, 0, 0))
+
+
+def portfolio(wrl: World, configs: list[tuple[Callable, float]], improve: float = 0.0,
+              timeout: Optional[float] = None) -> tuple[Optional[tuple[State, int, int]], dict]:
+    # Races every (heuristic, weight) in its own process. After the first plan the others get improve more
+    # seconds to find a cheaper one, then every process is stopped. Returns wastar's result and a report.
+    labels = [f"{getattr(h, '__name__', h)}:{w:g}" for h, w in configs]
+    start = perf_counter()
+    stop = start + timeout if timeout is not None else None
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    processes = [context.Process(target=portfolio_worker, args=(wrl, i, h, w, results), daemon=True)
+                 for i, (h, w) in enumerate(configs)]
+    for p in processes:
+        p.start()
+    best = None
+    report = {"configs": labels, "first": None, "first_time": None, "winner": None, "solutions": 0}
+    running = len(processes)
+    try:
+        while running > 0:
+            try:
+                wait = max(0.0, stop - perf_counter()) if stop is not None else None
+                i, path, generated, expanded = collect(results, processes, wait)
+            except queue.Empty:
+                break
+            if path is None:
+                running -= 1
+                continue
+            report["solutions"] += 1
+            if report["first"] is None:
+                report["first"] = labels[i]
+                report["first_time"] = perf_counter() - start
+                stop = min(stop, perf_counter() + improve) if stop is not None else perf_counter() + improve
+            if best is None or len(path) < len(best[0]):
+                best = (path, generated, expanded)
+                report["winner"] = labels[i]
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+    report["time"] = perf_counter() - start
+    if best is None:
+        return None, report
+    report["cost"] = len(best[0])
+    return (wrl.replay(best[0]), best[1], best[2]), report
+
+
+def anytime_weights(weight: float) -> list[float]:
+    # Halves the distance to 1 each restart, 5 -> 3 -> 2 -> 1.5 -> 1.25 -> 1.125 -> 1.
+    weights = [weight]
+    while weights[-1] > 1.2:
+        weights.append((weights[-1] + 1) / 2)
+    if weights[-1] > 1:
+        weights.append(1)
+    return weights
+
+
+def heuristic_name(heuristic: Callable) -> str:
+    # Names a heuristic in files that outlive a run, a HeuristicCache by the heuristic it caches.
+    if isinstance(heuristic, HeuristicCache):
+        heuristic = heuristic.heuristic
+    return getattr(heuristic, "__name__", type(heuristic).__name__)
 
 
 def h0(wrl, s):
@@ -548,91 +2300,154 @@ def h0(wrl, s):
 
 
 def hlits(wrl: World, s: State):
-    p_false = len(wrl.goal_state.preds)
-    for p in wrl.goal_state.preds:
-        if p in s.preds:
-            p_false -= 1
-    return p_false
+    return wrl.state_goal_counters(s)[1]
 
 
 def hlits_inv(wrl: World, s: State):
-    p_true = [p for p in wrl.goal_state.preds if p in s.preds]
-    return len(p_true)
+    return len(wrl.goal_atoms) - wrl.state_goal_counters(s)[1]
 
 
 def hmax(wrl: World, s: State):
-    t = 0
-    Q = s.copy()
-    while len(Q.preds) != 0 and len([x for x in Q.preds if x in wrl.goal_state.preds]) != len(wrl.goal_state.preds):
-        Qp = Q.copy()
-        Qp_children = []
-        valid_action_calls = wrl.ground(Q)
-        for call in valid_action_calls:
-            Qp_children.append(wrl.get_action_by_name(call.name).apply_action(Q, call, plus=True))
-        for child in Qp_children:
-            for pred in child.preds:
-                if pred not in Qp.preds:
-                    Qp.preds.append(pred)
-                    pred.became_true = t + 1
-        Q = Qp.copy()
-        t += 1
-    return t
+    return wrl.relaxed.hmax(s.counts)
 
 
 def hsum(wrl: World, s: State):
-    t = 0
-    Q = s.copy()
-    while len(Q.preds) != 0 and len([x for x in Q.preds if x in wrl.goal_state.preds]) != len(wrl.goal_state.preds):
-        Qp = Q.copy()
-        Qp_children = []
-        valid_action_calls = wrl.ground(Q)
-        for call in valid_action_calls:
-            Qp_children.append(wrl.get_action_by_name(call.name).apply_action(Q, call, plus=True))
-        for child in Qp_children:
-            for pred in child.preds:
-                if pred not in Qp.preds:
-                    Qp.preds.append(pred)
-                    pred.became_true = t + 1
-        Q = Qp.copy()
-        t += 1
-    return sum([x.became_true for x in Q.preds if x.became_true > 0])
+    return wrl.relaxed.hadd(s.counts)
+
+
+def hff(wrl: World, s: State):
+    return wrl.relaxed.hff(s.counts)
+
+
+HEURISTICS = {"h0": h0, "hlits": hlits, "hmax": hmax, "hsum": hsum, "hff": hff}
+GOAL_HEURISTICS = {h0, hlits, hlits_inv}
+PORTFOLIO = "hff:1,hff:3,hlits:2,hsum:2,hmax:1,h0:1"
 
 
 if __name__ == "__main__":
     in_file = None
     w = 0
     h = "h0"
+    seconds = None  # With a time limit the search restarts with smaller weights and keeps the cheapest plan.
+    workers = None  # --workers=N scores children in N processes.
+    vectorized = False  # --numpy scores children in batches with VectorBackend instead.
+    configs = None  # --portfolio[=h:w,...] races the configurations, --improve=S waits S more seconds for better plans.
+    improve = 0.0
+    hda = None  # --hda[=N] runs hash distributed A* over N processes.
+    external = None  # --external=DIR keeps the search in DIR, resuming what is there, --ram=MiB bounds its RAM.
+    ram = 256
+    checkpoint = None  # --checkpoint=FILE snapshots the search to FILE every --interval=S seconds and resumes from it.
+    interval = 60.0
+    out_file = None  # --out=FILE writes the plan to FILE instead of stdout.
+    stats = None  # --stats prints per phase timings and counters as JSON, --stats=FILE writes them to FILE.
+    stats_file = None
+    args = [a for a in argv[1:] if not a.startswith("--")]
+    for flag in [a for a in argv[1:] if a.startswith("--")]:
+        if flag.startswith("--workers="):
+            workers = int(flag[len("--workers="):])
+        elif flag == "--numpy":
+            vectorized = True
+        elif flag == "--portfolio" or flag.startswith("--portfolio="):
+            configs = [(HEURISTICS[c.split(":")[0]], float(c.split(":")[1]))
+                       for c in (flag[len("--portfolio="):] or PORTFOLIO).split(",")]
+        elif flag.startswith("--improve="):
+            improve = float(flag[len("--improve="):])
+        elif flag == "--hda" or flag.startswith("--hda="):
+            hda = int(flag[len("--hda="):] or 0)
+        elif flag.startswith("--external="):
+            external = flag[len("--external="):]
+        elif flag.startswith("--ram="):
+            ram = float(flag[len("--ram="):])
+        elif flag.startswith("--checkpoint="):
+            checkpoint = flag[len("--checkpoint="):]
+        elif flag.startswith("--interval="):
+            interval = float(flag[len("--interval="):])
+        elif flag.startswith("--out="):
+            out_file = flag[len("--out="):]
+        elif flag == "--stats" or flag.startswith("--stats="):
+            stats = SearchStats()
+            stats_file = flag[len("--stats="):] or None
+    if stats is not None and (configs is not None or hda is not None):
+        print("--stats measures a search run in this process, it cannot be combined with --portfolio or --hda.")
+        exit(1)
     try:
-        w = float(argv[1])
-        h = argv[2]
-        in_file = argv[3]
+        w = float(args[0])
+        h = args[1]
+        in_file = args[2]
+        seconds = float(args[3])
     except IndexError:
         pass
 
-    if in_file is None:
-        in_str = stdin.read()
-    else:
-        with open(in_file, "r") as f:
-            in_str = f.read()
-    world_tokens = World.parse(in_str)
-    world = World(world_tokens[1],
-                  world_tokens[2],
-                  world_tokens[3],
-                  world_tokens[4],
-                  world_tokens[5])
-
-    if h == "h0":
-        win_state = world.wastar(h0, w)
-    elif h == "hlits":
-        win_state = world.wastar(hlits, w)
-    elif h == "hmax":
-        win_state = world.wastar(hmax, w)
-    elif h == "hsum":
-        win_state = world.wastar(hsum, w)
+    try:
+        if in_file is None:
+            world = World.read(stdin)
+        else:
+            with open(in_file, "r") as f:
+                world = World.read(f)
+    except ParseError as e:
+        print(f"{in_file or '<stdin>'}: {e}")
+        exit(1)
+
+    heuristic = HEURISTICS.get(h, h0)
+
+    pool = None
+    if vectorized and configs is None:
+        try:
+            pool = VectorBackend(world, heuristic)
+        except ImportError as e:
+            print(e)
+            exit(1)
+    elif workers is not None and configs is None:
+        pool = HeuristicPool(world, heuristic, workers)
+    if configs is not None:
+        win_state, report = portfolio(world, configs, improve, seconds)
+        if report["winner"] is not None:
+            print(f"Portfolio: {report['winner']} won out of {', '.join(report['configs'])}"
+                  f" (first plan by {report['first']} after {report['first_time']:.2f}s,"
+                  f" {report['solutions']} plans in {report['time']:.2f}s)")
+        else:
+            print(f"Portfolio: none of {', '.join(report['configs'])} found a plan in {report['time']:.2f}s")
+    elif hda is not None:
+        win_state = world.hdastar(heuristic, w, hda or None)
+    elif external is not None:
+        try:
+            win_state = world.external_wastar(heuristic, w, external, int(ram * 2 ** 20),
+                                              perf_counter() + seconds if seconds is not None else None, pool, stats)
+        except SearchTimeout:
+            print(f"Out of time, run again with --external={external} to continue.")
+            exit(2)
+    elif checkpoint is not None:
+        # A time limit here ends the run with a snapshot instead of restarting with smaller weights.
+        try:
+            win_state = world.wastar(heuristic, w, perf_counter() + seconds if seconds is not None else None,
+                                     pool=pool, stats=stats, checkpoint=Checkpoint(checkpoint, interval))
+        except SearchTimeout:
+            print(f"Out of time, run again with --checkpoint={checkpoint} to continue.")
+            exit(2)
+        except ValueError as e:
+            print(e)
+            exit(1)
+    elif seconds is None:
+        win_state = world.wastar(heuristic, w, pool=pool, stats=stats)
     else:
-        win_state = world.wastar(h0, w)
+        win_state = world.anytime_wastar(heuristic, anytime_weights(w), perf_counter() + seconds, pool, stats)
+    if isinstance(pool, HeuristicPool):
+        pool.close()
 
     if win_state is not None:
-        print(f"{win_state[0].print_acts()}\n{win_state[1]} nodes generated\n{win_state[2]} nodes expanded")
+        if out_file is None:
+            print()
+            win_state[0].plan().write(stdout)
+        else:
+            with open(out_file, "w") as f:
+                win_state[0].plan().write(f)
+        print(f"{win_state[1]} nodes generated\n{win_state[2]} nodes expanded")
     else:
         print("Solution could not be found.")
+
+    if stats is not None:
+        if stats_file is None:
+            print(stats.to_json())
+        else:
+            with open(stats_file, "w") as f:
+                f.write(stats.to_json())
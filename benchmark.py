@@ -0,0 +1,242 @@
+import io
+import json
+import multiprocessing
+import platform
+from datetime import datetime
+from resource import getrusage, RUSAGE_SELF
+from sys import argv
+from time import perf_counter
+
+import Checkers
+import PDDL
+
+
+SIZES = [4, 6, 8, 10]
+WEIGHTS = [1, 2, 5]
+PARTIAL_DEPTH = 3
+
+
+def capture_heavy_board(size):
+    # Red pieces on a sparse grid with free squares around them, so each can be captured four ways.
+    board = Checkers.Board(size)
+    board.pieces = [Checkers.Piece("B", (0, 0))]
+    for i in range(1, size - 1, 3):
+        for j in range(1, size - 1, 3):
+            board.pieces.append(Checkers.Piece("R", (i, j)))
+    return board
+
+
+def endgame_board(size):
+    # Two black men against two red men in the middle of the board.
+    board = Checkers.Board(size)
+    middle = size // 2
+    board.pieces = [Checkers.Piece("B", (0, 0)), Checkers.Piece("B", (2, 0)),
+                    Checkers.Piece("R", (middle - 1, middle - 1)), Checkers.Piece("R", (middle + 1, middle))]
+    return board
+
+
+LAYOUTS = {"opening": Checkers.Board, "sparse": capture_heavy_board, "endgame": endgame_board}
+
+
+def layout_board(size, layout):
+    # Piece names come from a global counter, restart it so every run names pieces the same way.
+    Checkers.Piece.last_discriminator = 0
+    board = LAYOUTS[layout](size)
+    Checkers.Piece.last_discriminator = 0
+    for p in board.pieces:
+        Checkers.Piece.last_discriminator += 1
+        p.discriminator = Checkers.Piece.last_discriminator
+        p.pddl_name = f"{p.color}{p.discriminator}"
+    return board
+
+
+def token_parse(text):
+    # The original two pass path, tokens first and objects after.
+    scratch = PDDL.World.__new__(PDDL.World)
+    tokens = PDDL.World.parse(text)
+    return [[scratch.objectify(tk) for tk in part] for part in tokens[1:]]
+
+
+def stream_parse(text):
+    parser = PDDL.StreamParser()
+    for line in io.StringIO(text):
+        parser.feed(line)
+    return parser
+
+
+def parse_throughput(size=40, repeat=20):
+    text = capture_heavy_board(size).generate_pddl()
+    lines = text.count("\n") + 1
+    actions = len(stream_parse(text).actions)
+    print(f"{size}x{size} board: {actions} actions, {lines} lines, {len(text) / 1024:.1f} KiB")
+    for name, parse in [("token", token_parse), ("stream", stream_parse)]:
+        start = perf_counter()
+        for _ in range(repeat):
+            parse(text)
+        elapsed = (perf_counter() - start) / repeat
+        print(f"{name:>6}: {elapsed * 1000:8.2f} ms  {lines / elapsed:10.0f} lines/s  "
+              f"{len(text) / elapsed / 2 ** 20:6.2f} MiB/s")
+
+
+def suite_cases(sizes=SIZES, layouts=LAYOUTS, heuristics=PDDL.HEURISTICS, weights=WEIGHTS):
+    cases = []
+    for size in sizes:
+        for layout in layouts:
+            cases.append({"id": f"{size}/{layout}/parse", "size": size, "layout": layout, "phase": "parse"})
+            cases.append({"id": f"{size}/{layout}/build", "size": size, "layout": layout, "phase": "build"})
+            for search in ["wastar", "partial_wastar"]:
+                for h in heuristics:
+                    for w in weights:
+                        cases.append({"id": f"{size}/{layout}/{search}/{h}/{w:g}", "size": size, "layout": layout,
+                                      "phase": "search", "search": search, "heuristic": h, "weight": w})
+    return cases
+
+
+def run_case(case, limit):
+    # Times one case in this process and returns its measurements. peak_memory is how far the process's
+    # peak RSS rose during the case, in bytes.
+    result = dict(case)
+    board = layout_board(case["size"], case["layout"])
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    if case["phase"] == "parse":
+        text = board.generate_pddl()
+        start = perf_counter()
+        PDDL.World.read(io.StringIO(text))
+        result["bytes"] = len(text)
+    elif case["phase"] == "build":
+        world = board.compile_world()
+        result["ground"] = world.ground_time
+        result["operators"] = len(world.operators)
+        result["atoms"] = len(world.symbols)
+    else:
+        world = board.compile_world()
+        start = perf_counter()
+        stats = PDDL.SearchStats()
+        heuristic = PDDL.HEURISTICS[case["heuristic"]]
+        result["timeout"] = False
+        try:
+            if case["search"] == "wastar":
+                found = world.wastar(heuristic, case["weight"], start + limit, stats=stats)
+                result["cost"] = found[0].cost if found is not None else None
+            else:
+                found = world.partial_wastar(heuristic, PDDL.hlits_inv, case["weight"], PARTIAL_DEPTH, start + limit,
+                                             stats=stats)
+                result["results"] = len(found)
+        except PDDL.SearchTimeout:
+            result["timeout"] = True
+        result["generated"] = stats.generated
+        result["expanded"] = stats.expanded
+        result["nodes_per_second"] = stats.as_dict()["nodes_per_second"]
+        result["times"] = stats.times
+    result["wall"] = perf_counter() - start
+    result["peak_memory"] = (getrusage(RUSAGE_SELF).ru_maxrss - rss) * 1024
+    return result
+
+
+def case_process(case, limit, conn):
+    conn.send(run_case(case, limit))
+    conn.close()
+
+
+def run_suite(cases, limit=2.0, out=None):
+    # Each case runs in a fresh process so peak memory and caches do not leak from one case into the next.
+    # Searches stop at the time limit, a case that overruns it by far is killed and marked as a timeout.
+    context = multiprocessing.get_context()
+    results = []
+    for case in cases:
+        receiver, sender = context.Pipe(duplex=False)
+        p = context.Process(target=case_process, args=(case, limit, sender))
+        p.start()
+        sender.close()
+        if receiver.poll(limit * 2 + 30):
+            try:
+                result = receiver.recv()
+            except EOFError:  # The case process died before sending anything.
+                p.join()
+                result = dict(case, failed=True, wall=None, exitcode=p.exitcode)
+        else:
+            p.terminate()
+            result = dict(case, timeout=True, wall=None, killed=True)
+        p.join()
+        results.append(result)
+        print(f"{case['id']:<40} {result['wall'] if result['wall'] is not None else float('nan'):8.3f}s"
+              f"{'  timeout' if result.get('timeout') else ''}"
+              f"{'  failed, exit code ' + str(result['exitcode']) if result.get('failed') else ''}")
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "machine": platform.machine(), "limit": limit, "cases": results}
+    if out is not None:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def compare(old, new, threshold=0.1):
+    # Cases present in both runs whose wall time, search speed or memory got worse by more than threshold
+    # (relative), or that stopped finishing or found a costlier plan. Small absolute slack on time and memory
+    # keeps millisecond cases from flagging on noise.
+    old_cases = {c["id"]: c for c in old["cases"]}
+    regressions = []
+    for case in new["cases"]:
+        before = old_cases.get(case["id"])
+        if before is None:
+            continue
+        problems = []
+        if case.get("failed") or before.get("failed"):
+            if case.get("failed") and not before.get("failed"):
+                problems.append(f"now fails with exit code {case['exitcode']}")
+        elif case.get("timeout") and not before.get("timeout"):
+            problems.append("now times out")
+        elif not case.get("timeout") and not before.get("timeout"):
+            if before.get("wall") and case["wall"] > before["wall"] * (1 + threshold) + 0.005:
+                problems.append(f"wall {before['wall']:.3f}s -> {case['wall']:.3f}s")
+            if case.get("cost") is not None and before.get("cost") is not None and case["cost"] > before["cost"]:
+                problems.append(f"cost {before['cost']} -> {case['cost']}")
+        if before.get("nodes_per_second") and case.get("nodes_per_second") is not None \
+                and case["nodes_per_second"] < before["nodes_per_second"] * (1 - threshold):
+            problems.append(f"nodes/s {before['nodes_per_second']:.0f} -> {case['nodes_per_second']:.0f}")
+        if before.get("peak_memory") and case.get("peak_memory") is not None \
+                and case["peak_memory"] > before["peak_memory"] * (1 + threshold) + 2 ** 20:
+            problems.append(f"peak memory {before['peak_memory'] / 2 ** 20:.1f} -> "
+                            f"{case['peak_memory'] / 2 ** 20:.1f} MiB")
+        if len(problems) > 0:
+            regressions.append((case["id"], problems))
+    return regressions
+
+
+def option(args, name, default):
+    for a in args:
+        if a.startswith(f"--{name}="):
+            return a[len(name) + 3:]
+    return default
+
+
+if __name__ == "__main__":
+    if len(argv) > 1 and argv[1] == "parse":
+        parse_throughput(*[int(a) for a in argv[2:4]])
+    elif len(argv) > 1 and argv[1] == "suite":
+        # benchmark.py suite [out.json] [--sizes=4,6] [--layouts=opening] [--heuristics=hff] [--weights=1,2]
+        #                          [--limit=seconds]
+        flags = [a for a in argv[2:] if a.startswith("--")]
+        positional = [a for a in argv[2:] if not a.startswith("--")]
+        cases = suite_cases([int(s) for s in option(flags, "sizes", ",".join(map(str, SIZES))).split(",")],
+                            option(flags, "layouts", ",".join(LAYOUTS)).split(","),
+                            option(flags, "heuristics", ",".join(PDDL.HEURISTICS)).split(","),
+                            [float(w) for w in option(flags, "weights", ",".join(map(str, WEIGHTS))).split(",")])
+        run_suite(cases, float(option(flags, "limit", "2")), positional[0] if len(positional) > 0 else "benchmark.json")
+    elif len(argv) > 3 and argv[1] == "compare":
+        # benchmark.py compare old.json new.json [--threshold=0.1], exits 1 when something regressed.
+        with open(argv[2]) as f:
+            old_run = json.load(f)
+        with open(argv[3]) as f:
+            new_run = json.load(f)
+        found = compare(old_run, new_run, float(option(argv[4:], "threshold", "0.1")))
+        for case_id, problems in found:
+            print(f"REGRESSION {case_id}: {'; '.join(problems)}")
+        print(f"{len(found)} regressions in {len(new_run['cases'])} cases")
+        exit(1 if len(found) > 0 else 0)
+    else:
+        print("Usage: benchmark.py parse [board size] [repeat]\n"
+              "       benchmark.py suite [out.json] [--sizes=..] [--layouts=..] [--heuristics=..] [--weights=..]"
+              " [--limit=s]\n"
+              "       benchmark.py compare old.json new.json [--threshold=0.1]")
@@ -0,0 +1,29 @@
+from time import perf_counter
+
+import Checkers
+import PDDL
+
+
+def small_world():
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(6)
+    board.pieces = [Checkers.Piece("B", (1, 0)), Checkers.Piece("B", (3, 0)),
+                    Checkers.Piece("R", (2, 1)), Checkers.Piece("R", (4, 3)), Checkers.Piece("R", (2, 3))]
+    return board.compile_world()
+
+
+def test_resume_after_tiny_deadlines(tmp_path):
+    world = small_world()
+    full = world.external_wastar(PDDL.hmax, 1, str(tmp_path / "full"))
+    timeouts = 0
+    while True:
+        try:
+            resumed = world.external_wastar(PDDL.hmax, 1, str(tmp_path / "resumed"), deadline=perf_counter() + 0.002)
+            break
+        except PDDL.SearchTimeout:
+            timeouts += 1
+            assert timeouts < 10000
+    assert timeouts > 1
+    assert [str(op) for op in resumed[0].actions()] == [str(op) for op in full[0].actions()]
+    assert resumed[0].cost == full[0].cost
+    assert resumed[1:] == full[1:]
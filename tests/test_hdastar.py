@@ -0,0 +1,46 @@
+import pytest
+
+import Checkers
+import PDDL
+
+
+def world(pieces):
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(6)
+    board.pieces = [Checkers.Piece(color, location) for color, location in pieces]
+    return board.compile_world()
+
+
+SOLVABLE = [("B", (1, 0)), ("B", (3, 0)), ("R", (2, 1)), ("R", (4, 3)), ("R", (2, 3))]
+UNSOLVABLE = [("B", (2, 2)), ("R", (1, 0))]  # Black only moves forward, the red piece is behind it.
+
+
+def failing(wrl, s):
+    raise ValueError("heuristic failed")
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_same_cost_as_wastar(workers):
+    wrl = world(SOLVABLE)
+    for heuristic in [PDDL.h0, PDDL.hlits]:
+        expected = wrl.wastar(heuristic, 1)
+        found = wrl.hdastar(heuristic, 1, workers)
+        assert found[0].cost == expected[0].cost
+        assert wrl.goal_reached(wrl.replay(wrl.operator_path(found[0])).counts)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_unsolvable(workers):
+    wrl = world(UNSOLVABLE)
+    assert wrl.wastar(PDDL.hlits, 1) is None
+    assert wrl.hdastar(PDDL.hlits, 1, workers) is None
+
+
+def test_dead_worker_is_reported():
+    with pytest.raises(RuntimeError):
+        world(SOLVABLE).hdastar(failing, 1, 2)
+
+
+def test_dead_portfolio_worker_is_reported():
+    with pytest.raises(RuntimeError):
+        PDDL.portfolio(world(SOLVABLE), [(failing, 1)])
@@ -0,0 +1,17 @@
+import Checkers
+
+
+def test_session_reuses_heuristic_values_across_turns():
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.BitBoard(6)
+    board.pieces = [Checkers.Piece("B", (1, 0)), Checkers.Piece("B", (3, 0)),
+                    Checkers.Piece("R", (2, 1)), Checkers.Piece("R", (4, 3)), Checkers.Piece("R", (2, 3))]
+    board.reindex()
+    session = Checkers.PlanningSession(board, depth=2)
+    board.move(*board.extract_plan(session.plan()[0])[0])
+    board.move((4, 3), "fl")
+    fingerprint = session.world.fingerprint
+    hits = session.heuristic.hits
+    session.plan()
+    assert session.world.fingerprint != fingerprint  # The red move changed the capture actions.
+    assert session.heuristic.hits > hits
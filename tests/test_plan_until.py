@@ -0,0 +1,25 @@
+from time import perf_counter
+
+import Checkers
+
+
+def session(size, budget):
+    Checkers.Piece.last_discriminator = 0
+    planner = Checkers.PlanningSession(Checkers.BitBoard(size), budget=budget)
+    planner.sync()  # Grounding and the first sync are not part of a move's budget.
+    return planner
+
+
+def test_first_level_stops_at_the_deadline():
+    planner = session(16, 0.05)
+    start = perf_counter()
+    plans = planner.plan()
+    assert perf_counter() - start < 0.4  # A full first level takes close to a second on this board.
+    assert len(plans) > 0
+
+
+def test_spent_budget_still_gives_first_moves():
+    planner = session(8, 0.0)
+    plans = planner.plan()
+    assert len(plans) == len(planner.world.applicable(planner.world.inital_state.counts)) > 0
+    assert all(p.cost == 1 and len(planner.board.extract_plan(p)) == 1 for p in plans)
@@ -0,0 +1,27 @@
+import Checkers
+import PDDL
+
+
+def test_peak_closed_counts_distinct_states():
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(5)
+    board.pieces = [Checkers.Piece("B", (4, 4)), Checkers.Piece("B", (2, 3)),
+                    Checkers.Piece("R", (0, 1)), Checkers.Piece("R", (1, 3)), Checkers.Piece("R", (3, 1))]
+    wrl = board.compile_world()
+    expanded = set()
+    applicable = wrl.applicable
+    wrl.applicable = lambda counts: expanded.add(counts) or applicable(counts)
+    stats = PDDL.SearchStats()
+    assert wrl.wastar(PDDL.hlits, 3, stats=stats) is None
+    assert stats.reopened > 0 and stats.expanded > len(expanded)  # Some states were expanded twice.
+    assert stats.peak_closed == len(expanded)  # Nothing is left open, every expanded state is closed at the end.
+
+
+def test_external_peak_closed_is_expansions(tmp_path):
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(6)
+    board.pieces = [Checkers.Piece("B", (1, 0)), Checkers.Piece("B", (3, 0)),
+                    Checkers.Piece("R", (2, 1)), Checkers.Piece("R", (4, 3)), Checkers.Piece("R", (2, 3))]
+    stats = PDDL.SearchStats()
+    found = board.compile_world().external_wastar(PDDL.hmax, 1, str(tmp_path), stats=stats)
+    assert stats.peak_closed == found[2] > 0
@@ -0,0 +1,56 @@
+import Checkers
+import PDDL
+
+
+def session_board():
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.BitBoard(6)
+    board.pieces = [Checkers.Piece("B", (1, 0)), Checkers.Piece("B", (3, 0)),
+                    Checkers.Piece("R", (2, 1)), Checkers.Piece("R", (4, 3)), Checkers.Piece("R", (2, 3))]
+    board.reindex()
+    return board
+
+
+def replays(world, state):
+    counts = world.inital_state.counts
+    for op in state.actions():
+        if op not in world.operators or not op.applicable(counts):
+            return False
+        counts = op.successor(counts)
+    return counts == state.counts
+
+
+def test_deepening_a_tree_matches_fresh_searches():
+    world = session_board().compile_world()
+    tree = PDDL.SearchTree(world, PDDL.hlits, 2)
+    for depth in range(1, 5):
+        grown = world.partial_wastar(PDDL.hlits, PDDL.hlits_inv, 2, depth, tree=tree)
+        fresh = world.partial_wastar(PDDL.hlits, PDDL.hlits_inv, 2, depth)
+        assert [s.counts for s in grown] == [s.counts for s in fresh]
+        assert [s.actions() for s in grown] == [s.actions() for s in fresh]
+
+
+def test_session_keeps_the_subtree_below_the_new_position():
+    board = session_board()
+    session = Checkers.PlanningSession(board, depth=2)
+    board.move(*board.extract_plan(session.plan()[0])[0])
+    board.move((4, 3), "fl")
+    expanded = dict(session.tree.closed)
+    session.sync()
+    session.tree.follow(session.world)
+    assert session.tree.nodes.keys[0] == PDDL.NodeStore.pack(session.world.inital_state.counts)
+    assert 0 < len(session.tree.closed) < len(expanded)
+    assert all(key in expanded for key in session.tree.closed)
+    for node in session.tree.best.values():
+        assert replays(session.world, session.tree.nodes.state(node))
+    for state in session.plan():
+        assert replays(session.world, state)
+        assert state.cost == 2 or session.world.state_goal_counters(state)[0] == 0
+
+
+def test_successor_cache_is_capped():
+    world = session_board().compile_world()
+    world.successor_cache = {}
+    world.successor_cache_size = 3
+    world.partial_wastar(PDDL.hlits, PDDL.hlits_inv, 2, 3)
+    assert len(world.successor_cache) == 3
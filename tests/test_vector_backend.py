@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+import Checkers
+import PDDL
+
+np = pytest.importorskip("numpy")
+
+
+def random_world(size, rng):
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(size)
+    squares = rng.sample([(x, y) for x in range(size) for y in range(size)], 5)
+    board.pieces = [Checkers.Piece(color, square) for color, square in zip("BBRRR", squares)]
+    return board.compile_world()
+
+
+def walk_states(wrl, rng, walks=20, steps=8):
+    states = [wrl.inital_state]
+    for _ in range(walks):
+        state = wrl.inital_state
+        for _ in range(steps):
+            ops = wrl.applicable(state.counts)
+            if len(ops) == 0:
+                break
+            state = rng.choice(ops).apply(state)
+            states.append(state)
+    return states
+
+
+@pytest.mark.parametrize("size", [4, 6, 8])
+def test_values_match_python(size):
+    rng = random.Random(size)
+    for _ in range(3):
+        wrl = random_world(size, rng)
+        states = walk_states(wrl, rng)
+        for heuristic in [PDDL.hlits, PDDL.hlits_inv, PDDL.hmax, PDDL.hsum, PDDL.hff]:
+            backend = PDDL.VectorBackend(wrl, heuristic)
+            assert backend.score(wrl, states) == [heuristic(wrl, s) for s in states]
+
+
+def test_searches_match_python():
+    rng = random.Random(4)
+    Checkers.Piece.last_discriminator = 0
+    board = Checkers.Board(6)
+    board.pieces = [Checkers.Piece("B", (1, 0)), Checkers.Piece("B", (3, 0)),
+                    Checkers.Piece("R", (2, 1)), Checkers.Piece("R", (4, 3)), Checkers.Piece("R", (2, 3))]
+    for wrl in [board.compile_world()] + [random_world(4, rng) for _ in range(3)]:
+        for heuristic in [PDDL.hlits, PDDL.hmax, PDDL.hsum, PDDL.hff]:
+            python = wrl.wastar(heuristic, 2)
+            vector = wrl.wastar(heuristic, 2, pool=PDDL.VectorBackend(wrl, heuristic))
+            if python is None:
+                assert vector is None
+                continue
+            assert vector[0].actions() == python[0].actions()
+            assert vector[1:] == python[1:]  # Same generated and expanded, every expansion saw the same operators.